@@ -1,5 +1,5 @@
 import { PatientProfile } from './data/patient-profiles'
-import { patientTypes, patientTypeDescriptions } from './data/patient-types'
+import { patientTypes } from './data/patient-types'
 import { auth } from '@/auth'
 import { kv } from '@vercel/kv'
 import { profile } from 'console'
@@ -17,11 +17,30 @@ async function getUserID(): Promise<string | null> {
   return session?.user ? session?.user?.id : null
 }
 
+// Resolve the prompt whenever the profile or patient type changes, so that
+// `getPrompt` on every chat message is a single read. Prompts are rendered
+// ahead of time by `python3 -m generation.kv upload`.
+async function storePrompt(
+  userID: string | null,
+  profile: PatientProfile | null,
+  patientType: string | null
+) {
+  const promptKey = `curr_prompt_${userID}`
+  if (!profile || !patientType) {
+    await kv.del(promptKey)
+    return
+  }
+  const prompt = await kv.get<string>(`prompt:${profile.id}:${patientType}`)
+  await kv.set(promptKey, prompt ?? formatPromptString(profile, patientType))
+}
+
 export async function setProfile(newProfile: PatientProfile | null) {
   try {
     const userID = await getUserID()
     const profileKey = `curr_profile_${userID}`
     await kv.set(profileKey, JSON.stringify(newProfile))
+    const patientType = await kv.get<string>(`curr_type_${userID}`)
+    await storePrompt(userID, newProfile, patientType)
   } catch (error) {
     console.error('Error storing patient profile to KV:', error)
   }
@@ -39,6 +58,8 @@ export async function setPatientType(patientType: string) {
     const userID = await getUserID()
     const patientTypeKey = `curr_type_${userID}`
     await kv.set(patientTypeKey, patientType)
+    const profile = await kv.get<PatientProfile>(`curr_profile_${userID}`)
+    await storePrompt(userID, profile, patientType)
   } catch (error) {
     console.error('Error storing patient type to KV:', error)
   }
@@ -82,6 +103,41 @@ export async function getPatientType(): Promise<string> {
 
 // }
 
+// The sampling index is maintained by `python3 -m generation.kv upload`
+// and `lib/utils/kvDatabaseFunctions.ts`
+const PROFILE_IDS_KEY = 'idx:profile:ids'
+const SAMPLE_ATTEMPTS = 3
+
+async function sampleIndexedProfile(): Promise<PatientProfile | null> {
+  for (let attempt = 0; attempt < SAMPLE_ATTEMPTS; attempt++) {
+    const profileId = await kv.srandmember<string>(PROFILE_IDS_KEY)
+    if (!profileId) {
+      return null
+    }
+    const profileData = await kv.get(`profile_${profileId}`)
+    if (profileData) {
+      return profileData as PatientProfile
+    }
+    // The profile was deleted without updating the index. The facet sets
+    // are cleaned up by `python3 -m generation.kv sample` or `index rebuild`
+    await kv.srem(PROFILE_IDS_KEY, profileId)
+  }
+  return null
+}
+
+// Profiles uploaded without the index: fall back to scanning all keys
+async function sampleScannedProfile(): Promise<PatientProfile | null> {
+  const all_keys = await kv.keys('profile_*')
+
+  if (all_keys.length === 0) {
+    throw new Error('No profiles found')
+  }
+
+  const randomIndex = Math.floor(Math.random() * all_keys.length)
+  const profileData = await kv.get(all_keys[randomIndex])
+  return profileData ? (profileData as PatientProfile) : null
+}
+
 export async function sampleProfile(): Promise<PatientProfile | null> {
   try {
     const userID = (await getUserID()) as string
@@ -104,27 +160,7 @@ export async function sampleProfile(): Promise<PatientProfile | null> {
       }
     }
 
-    const all_keys = await kv.keys('profile_*')
-
-    if (all_keys.length === 0) {
-      throw new Error('No profiles found')
-    }
-
-    const randomIndex = Math.floor(Math.random() * all_keys.length)
-    const randomKey = all_keys[randomIndex]
-
-    const profileData = await kv.get(randomKey)
-
-    if (!profileData) {
-      return null
-    }
-
-    try {
-      return profileData as PatientProfile
-    } catch (error) {
-      console.error('Error parsing profile data:', error)
-      return null
-    }
+    return (await sampleIndexedProfile()) ?? (await sampleScannedProfile())
   } catch (error) {
     console.error('Error sampling profile:', error)
     throw error
@@ -132,22 +168,40 @@ export async function sampleProfile(): Promise<PatientProfile | null> {
 }
 
 export async function getPrompt(): Promise<string> {
-  const profile = await getProfile()
-  return formatPromptString(profile)
+  const userID = await getUserID()
+  const prompt = await kv.get<string>(`curr_prompt_${userID}`)
+  if (prompt) {
+    return prompt
+  }
+  // Sessions started before the prompt was stored with the profile
+  const [profile, patientType] = await kv.mget<[PatientProfile | null, string | null]>(
+    `curr_profile_${userID}`,
+    `curr_type_${userID}`
+  )
+  return formatPromptString(profile, patientType)
 }
 
-async function formatPromptString(data: any): Promise<string> {
-  const patientType =
-    (await getPatientType()) as keyof typeof patientTypeDescriptions
+// Must render the same text as `render_prompt` in `python/generation/patient_prompt.py`
+function formatPromptString(data: any, patientType: string | null): string {
   // console.log(patientType);
   // const patientTypeContent = patientTypeDescriptions[patientType];
   const patientTypeContent = patientTypes.find(
     item => item.type === patientType
   )?.content
+  const coreBeliefs = [
+    ...(data.helpless_belief ?? []),
+    ...(data.unlovable_belief ?? []),
+    ...(data.worthless_belief ?? [])
+  ].join(' ')
+  const [intermediateBeliefs, intermediateBeliefsDepression = ''] =
+    data.intermediate_belief_depression !== undefined
+      ? [data.intermediate_belief, data.intermediate_belief_depression]
+      : data.intermediate_belief.split('\n[during depression]\n')
+  const emotions = (data.emotion ?? []).join(', ')
 
   return `Imagine you are ${data.name}, a patient who has been experiencing mental health challenges. You have been attending therapy sessions for several weeks. Your task is to engage in a conversation with the therapist as ${data.name} would during a cognitive behavioral therapy (CBT) session. Align your responses with ${data.name}'s background information provided in the 'Relevant history' section. Your thought process should be guided by the cognitive conceptualization diagram in the 'Cognitive Conceptualization Diagram' section, but avoid directly referencing the diagram as a real patient would not explicitly think in those terms. \n\n
-    Patient History: ${data.history}\n\nCognitive Conceptualization Diagram:\nCore Beliefs: ${data.core_belief}\nIntermediate Beliefs: ${data.intermediate_belief}\nIntermediate Beliefs during Depression: ${data.intermediate_belief_depression}\nCoping Strategies: ${data.coping_strategies}\n\n
-    You will be asked about your experiences over the past week. Engage in a conversation with the therapist regarding the following situation and behavior. Use the provided emotions and automatic thoughts as a reference, but do not disclose the cognitive conceptualization diagram directly. Instead, allow your responses to be informed by the diagram, enabling the therapist to infer your thought processes.\n\nSituation: ${data.situation}\nAutomatic Thoughts: ${data.auto_thoughts}\nEmotions: ${data.emotion}\nBehavior: ${data.behavior}\n\n
+    Patient History: ${data.history}\n\nCognitive Conceptualization Diagram:\nCore Beliefs: ${coreBeliefs}\nIntermediate Beliefs: ${intermediateBeliefs}\nIntermediate Beliefs during Depression: ${intermediateBeliefsDepression}\nCoping Strategies: ${data.coping_strategies}\n\n
+    You will be asked about your experiences over the past week. Engage in a conversation with the therapist regarding the following situation and behavior. Use the provided emotions and automatic thoughts as a reference, but do not disclose the cognitive conceptualization diagram directly. Instead, allow your responses to be informed by the diagram, enabling the therapist to infer your thought processes.\n\nSituation: ${data.situation}\nAutomatic Thoughts: ${data.auto_thought}\nEmotions: ${emotions}\nBehavior: ${data.behavior}\n\n
     In the upcoming conversation, you will simulate ${data.name} during the therapy session, while the user will play the role of the therapist. Adhere to the following guidelines:\n
     1. ${patientTypeContent}\n
     2. Emulate the demeanor and responses of a genuine patient to ensure authenticity in your interactions. Use natural language, including hesitations, pauses, and emotional expressions, to enhance the realism of your responses.\n
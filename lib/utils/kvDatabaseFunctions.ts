@@ -7,6 +7,9 @@ const { kv } = require('@vercel/kv')
 const { readFile } = require('fs/promises')
 const path = require('path')
 
+// Sampling index the app draws sessions from, see `python/generation/kv/index.py`
+const PROFILE_IDS_KEY = 'idx:profile:ids'
+
 async function storeDataToKV() {
   try {
     const dataFilePath = path.join(
@@ -20,7 +23,16 @@ async function storeDataToKV() {
       const id = profile.id
       const key = `profile_${id}`
 
+      // Prompts rendered from the previous version of the profile are stale;
+      // the app falls back to rendering them until the Python uploader runs
+      const previous = await kv.get(key)
+      const types = new Set([...(previous?.type ?? []), ...(profile.type ?? [])])
+      if (types.size > 0) {
+        await kv.del(...[...types].map(type => `prompt:${id}:${type}`))
+      }
+
       await kv.set(key, JSON.stringify(profile))
+      await kv.sadd(PROFILE_IDS_KEY, id)
       console.log(`Data for ${id} stored successfully with key ${key}`)
     }
   } catch (error) {
@@ -28,6 +40,8 @@ async function storeDataToKV() {
   }
 }
 
+// For large keyspaces prefer `python3 -m generation.kv delete <pattern>`,
+// which uses SCAN and batched UNLINKs instead of KEYS and one DEL per key
 async function deleteAllProfilesFromKV() {
   try {
     const dataFilePath = path.join(
@@ -42,6 +56,7 @@ async function deleteAllProfilesFromKV() {
       const key = `profile_${id}`
 
       await kv.del(key)
+      await kv.srem(PROFILE_IDS_KEY, id)
       console.log(`Profile with key ${key} deleted successfully`)
     }
 
@@ -57,6 +72,9 @@ async function deleteCustomPrefixFromKV(prefix: string) {
 
     for (const key of keys) {
       await kv.del(key)
+      if (key.startsWith('profile_')) {
+        await kv.srem(PROFILE_IDS_KEY, key.slice('profile_'.length))
+      }
       console.log(key, 'deleted successfully')
     }
   } catch (error) {
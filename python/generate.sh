@@ -1,3 +1,5 @@
 #!/bin/bash
 
-python3 -m generation.generate --transcript-file "example_transcript.txt" --out-file "example_CCD_from_transcript.json"
\ No newline at end of file
+python3 -m generation.generate --transcript-file "example_transcript.txt" --out-file "example_CCD_from_transcript.json"
+# Batch mode: every *.txt transcript under DATA_PATH, 8 requests in flight
+# python3 -m generation.generate --transcript-dir "." --glob "*.txt" --concurrency 8
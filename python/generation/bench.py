@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import logging
+import platform
+import tempfile
+import subprocess
+from statistics import median
+
+logger = logging.getLogger(__name__)
+
+# Packages the CLI must only import once a generation starts
+HEAVY_MODULES = ('langchain', 'langchain_core', 'langchain_openai', 'openai', 'httpx', 'pydantic')
+
+EXAMPLE_TRANSCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                  'example_transcript.txt')
+
+
+def import_budget_ms():
+    return float(os.getenv('IMPORT_BUDGET_MS', 150))
+
+
+def import_times(module):
+    """Cumulative import time in microseconds of every module `import module` loads."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def check_import_time(module='generation.generate', budget_ms=None, repeat=3):
+    """Return the problems found with how fast and how lightly `module` imports."""
+    budget_ms = budget_ms or import_budget_ms()
+    # The best of a few runs, so the first one can warm the bytecode cache
+    runs = [import_times(module) for _ in range(repeat)]
+    times = min(runs, key=lambda run: run[module])
+    elapsed_ms = times[module] / 1000
+    logger.info(f"import {module}: {elapsed_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+
+    problems = []
+    if elapsed_ms > budget_ms:
+        slowest = sorted(((time, name) for name, time in times.items()
+                          if name.count('.') == 0 and name != module), reverse=True)[:5]
+        problems.append(
+            f"import {module} took {elapsed_ms:.0f} ms, over the {budget_ms:.0f} ms budget. Slowest: "
+            + ', '.join(f"{name} {time / 1000:.0f} ms" for time, name in slowest))
+    heavy = sorted({name.split('.')[0] for name in times} & set(HEAVY_MODULES))
+    if heavy:
+        problems.append(f"import {module} eagerly loads {', '.join(heavy)}")
+    return problems
+
+
+def result(value, unit, better='lower', **extra):
+    return {"value": round(value, 4), "unit": unit, "better": better, **extra}
+
+
+def time_ms(function, repeat):
+    """Median and fastest wall time of `function` in milliseconds, after one warm-up call."""
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return median(times), min(times)
+
+
+def prepare_workspace(transcripts):
+    """Point DATA_PATH and OUT_PATH at a scratch directory holding copies of the example transcript."""
+    workspace = tempfile.mkdtemp(prefix='generation-bench-')
+    os.makedirs(os.path.join(workspace, 'data'))
+    names = [f"transcript_{index:03d}.txt" for index in range(transcripts)]
+    for name in names:
+        shutil.copy(EXAMPLE_TRANSCRIPT, os.path.join(workspace, 'data', name))
+    os.environ['DATA_PATH'] = os.path.join(workspace, 'data')
+    os.environ['OUT_PATH'] = os.path.join(workspace, 'out')
+    return workspace, names
+
+
+def micro(transcript_file, repeat=20):
+    """Time the stages of one generation that run locally."""
+    from langchain_core.output_parsers import PydanticOutputParser
+    from generation.generate import build_query
+    from generation.generation_template import GenerationModel
+    from generation.stub import synthesize
+
+    schema = GenerationModel.CognitiveConceptualizationDiagram
+    parser = PydanticOutputParser(pydantic_object=schema)
+    format_instructions = parser.get_format_instructions()
+    query = build_query(transcript_file)
+    data = synthesize(schema.model_json_schema(), random.Random(0))
+    response = json.dumps(data)
+    ccd = schema.model_validate(data)
+
+    stages = {
+        'build_query': lambda: build_query(transcript_file),
+        'prompt_template_invoke': lambda: GenerationModel.prompt_template.invoke(
+            {"query": query, "format_instructions": format_instructions}),
+        'get_format_instructions': parser.get_format_instructions,
+        'parse': lambda: parser.parse(response),
+        'validate': lambda: schema.model_validate(data),
+        'serialize': lambda: json.dumps(ccd.model_dump(), indent=4),
+    }
+    # build_query logs its token savings on every call
+    logging.getLogger('generation.transcript').setLevel(logging.WARNING)
+    results = {}
+    for name, function in stages.items():
+        median_ms, min_ms = time_ms(function, repeat)
+        # The fastest run is the least disturbed by other load on the machine
+        results[f"micro.{name}"] = result(min_ms, 'ms', median_ms=round(median_ms, 4))
+        logger.info(f"{name}: {min_ms:.3f} ms min, {median_ms:.3f} ms median")
+    return results
+
+
+def macro(transcript_files, concurrency_levels, stub_options, adaptive=False):
+    """Run whole batches against a local stub endpoint and measure their throughput.
+
+    With `adaptive`, each level is the ceiling of an `AdaptiveLimit` instead of a fixed limit.
+    """
+    from generation import stub
+    from generation.concurrency import AdaptiveLimit
+    from generation.generate import generate_batch
+
+    server = stub.start(**stub_options)
+    os.environ['OPENAI_BASE_URL'] = server.base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    # Keep per-request logs out of the report
+    for name in ('generation', 'httpx', 'openai'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    results = {}
+    try:
+        for concurrency in concurrency_levels:
+            server.stats.clear()
+            limit = AdaptiveLimit(concurrency) if adaptive else None
+            start = time.perf_counter()
+            failed = asyncio.run(generate_batch(transcript_files, concurrency, cache=None,
+                                                concurrency_limit=limit))
+            elapsed = time.perf_counter() - start
+            succeeded = len(transcript_files) - len(failed)
+            extra = {"final_limit": limit.current, "lowest_limit": limit.lowest} if limit else {}
+            name = f"macro.batch_{'adaptive' if adaptive else 'c'}{concurrency}"
+            results[name] = result(
+                succeeded / elapsed, 'transcripts/s', 'higher', seconds=round(elapsed, 3),
+                failed=len(failed), requests=server.stats['requests'],
+                rejected=server.stats['status_429'] + server.stats['status_503'],
+                slow=server.stats['slow'], **extra)
+            logger.info(
+                f"concurrency {concurrency}: {succeeded / elapsed:.2f} transcripts/s, "
+                f"{server.stats['requests']} requests, {len(failed)} failed")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def run(suites, repeat=20, transcripts=16, concurrency_levels=(1, 4, 16), stub_options=None,
+        adaptive=False):
+    workspace, names = prepare_workspace(transcripts)
+    results = {}
+    try:
+        if 'import' in suites:
+            times = min((import_times('generation.generate') for _ in range(3)),
+                        key=lambda run: run['generation.generate'])
+            results['import.generation_generate'] = result(times['generation.generate'] / 1000, 'ms')
+        if 'micro' in suites:
+            results.update(micro(names[0], repeat))
+        if 'macro' in suites:
+            results.update(macro(names, concurrency_levels, stub_options or {}, adaptive))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return {
+        "meta": {
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "repeat": repeat,
+            "transcripts": transcripts,
+            "stub": stub_options or {},
+            "adaptive": adaptive,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=0.1):
+    """Compare two result files and return one line per benchmark plus the regressions."""
+    lines, regressions = [], []
+    for name, now in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None or not before['value']:
+            lines.append(f"{name}: {now['value']} {now['unit']} (new)")
+            continue
+        change = now['value'] / before['value'] - 1
+        worse = change > tolerance if now['better'] == 'lower' else change < -tolerance
+        line = f"{name}: {before['value']} -> {now['value']} {now['unit']} ({change:+.1%})"
+        lines.append(line + (' REGRESSION' if worse else ''))
+        if worse:
+            regressions.append(line)
+    return lines, regressions
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def report_comparison(baseline_path, current, tolerance):
+    lines, regressions = compare(load_results(baseline_path), current, tolerance)
+    for line in lines:
+        print(line)
+    if regressions:
+        logger.error(f"{len(regressions)} benchmarks regressed by more than {tolerance:.0%}")
+        raise SystemExit(1)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog='python3 -m generation.bench', description="Benchmarks for the generation pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importtime_parser = commands.add_parser(
+        'importtime', help="Check the CLI import time against a budget with `python -X importtime`")
+    importtime_parser.add_argument('--module', type=str, default='generation.generate')
+    importtime_parser.add_argument('--budget-ms', type=float, default=None,
+                                   help="Import time budget (default: IMPORT_BUDGET_MS or 150)")
+    importtime_parser.add_argument('--repeat', type=int, default=3)
+
+    run_parser = commands.add_parser('run', help="Run the benchmark suites and store the results as JSON")
+    run_parser.add_argument('--suite', choices=['import', 'micro', 'macro', 'all'], default='all')
+    run_parser.add_argument('--out', type=str, default=None,
+                            help="Write the results to this file, e.g. to keep as a baseline")
+    run_parser.add_argument('--compare', type=str, default=None, metavar='BASELINE',
+                            help="Compare the results with a baseline and fail on regressions")
+    run_parser.add_argument('--tolerance', type=float, default=0.1,
+                            help="Relative slowdown tolerated before a benchmark counts as a regression")
+    run_parser.add_argument('--repeat', type=int, default=20,
+                            help="Timed runs of every micro benchmark")
+    run_parser.add_argument('--transcripts', type=int, default=16,
+                            help="Transcripts per batch in the macro benchmark")
+    run_parser.add_argument('--concurrency', type=str, default='1,4,16',
+                            help="Comma-separated concurrency levels of the macro benchmark")
+    run_parser.add_argument('--stub-latency-ms', type=float, default=200)
+    run_parser.add_argument('--stub-tokens-per-second', type=float, default=0)
+    run_parser.add_argument('--stub-rate-limit-rate', type=float, default=0.0)
+    run_parser.add_argument('--stub-malformed-rate', type=float, default=0.0)
+    run_parser.add_argument('--stub-slow-rate', type=float, default=0.0)
+    run_parser.add_argument('--stub-slow-ms', type=float, default=5000)
+    run_parser.add_argument('--stub-capacity', type=int, default=0,
+                            help="Requests the stub works on at once before queueing the rest")
+    run_parser.add_argument('--adaptive', action='store_true',
+                            help="Treat each concurrency level as the ceiling of an adaptive limit")
+
+    compare_parser = commands.add_parser('compare', help="Compare two result files")
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('current', type=str)
+    compare_parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        suites = ['import', 'micro', 'macro'] if args.suite == 'all' else [args.suite]
+        stub_options = {"latency_ms": args.stub_latency_ms, "jitter_ms": 0,
+                        "tokens_per_second": args.stub_tokens_per_second,
+                        "rate_limit_rate": args.stub_rate_limit_rate,
+                        "malformed_rate": args.stub_malformed_rate,
+                        "slow_rate": args.stub_slow_rate, "slow_ms": args.stub_slow_ms,
+                        "capacity": args.stub_capacity}
+        current = run(suites, args.repeat, args.transcripts,
+                      [int(level) for level in args.concurrency.split(',')], stub_options,
+                      args.adaptive)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(current, f, indent=4)
+            logger.info(f"Results written to {args.out}")
+        if args.compare:
+            report_comparison(args.compare, current, args.tolerance)
+    elif args.command == 'compare':
+        report_comparison(args.baseline, load_results(args.current), args.tolerance)
+    elif args.command == 'importtime':
+        problems = check_import_time(args.module, args.budget_ms, args.repeat)
+        for problem in problems:
+            logger.error(problem)
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_MB = 512
+
+
+class ResponseCache:
+    """Persistent cache of raw LLM responses keyed by the rendered request."""
+
+    def __init__(self, path, max_age_days=DEFAULT_MAX_AGE_DAYS, max_mb=DEFAULT_MAX_MB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_age = max_age_days * 24 * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+            "created_at REAL, accessed_at REAL)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+        self.prune()
+
+    @staticmethod
+    def key(_input, llm, extra=None):
+        payload = {
+            "messages": [[message.type, message.content] for message in _input.to_messages()],
+            "model": llm.model_name,
+            "temperature": llm.temperature,
+        }
+        if extra:
+            payload["extra"] = extra
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        now = time.time()
+        if now - created_at > self.max_age:
+            self.delete(key)
+            return None
+        self.conn.execute(
+            "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        return response
+
+    def put(self, key, model, response):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, len(response.encode('utf-8')), now, now))
+        self.conn.commit()
+
+    def delete(self, key):
+        self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.conn.commit()
+
+    def prune(self):
+        expired = self.conn.execute(
+            "DELETE FROM responses WHERE created_at < ?",
+            (time.time() - self.max_age,)).rowcount
+        total = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        evicted = 0
+        if total > self.max_bytes:
+            # Drop least recently used entries until we are back under budget
+            for key, size in self.conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self.conn.commit()
+        if expired or evicted:
+            logger.info(
+                f"Response cache pruned: {expired} expired, {evicted} evicted")
+
+    def close(self):
+        self.conn.close()
+
+
+def open_cache(base_dir):
+    path = os.path.join(base_dir, os.getenv('CACHE_PATH', '.cache/responses.sqlite'))
+    return ResponseCache(
+        path,
+        max_age_days=float(os.getenv('CACHE_MAX_AGE_DAYS', DEFAULT_MAX_AGE_DAYS)),
+        max_mb=float(os.getenv('CACHE_MAX_MB', DEFAULT_MAX_MB)),
+    )
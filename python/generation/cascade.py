@@ -0,0 +1,70 @@
+import os
+import logging
+import importlib
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Free-text fields of the diagram a model can leave hollow and still validate
+TEXT_FIELDS = ('life_history', 'intermediate_beliefs', 'intermediate_beliefs_during_depression',
+               'coping_strategies')
+MODEL_FIELDS = ('situation', 'automatic_thoughts', 'behavior')
+PLACEHOLDERS = {'', 'n/a', 'na', 'none', 'unknown', 'not mentioned', 'not discussed',
+                'not specified', 'not applicable', '...', '-'}
+
+# Per model: transcripts tried, accepted, invalid, rejected by the quality check
+# and failed with an API error
+tier_stats = defaultdict(Counter)
+
+
+def cascade_models(models=None):
+    """Cheaper models to try, in order, before GENERATOR_MODEL (default: CASCADE_MODELS)."""
+    models = os.getenv('CASCADE_MODELS') if models is None else models
+    return [model.strip() for model in (models or '').split(',') if model.strip()]
+
+
+def min_text_chars():
+    return int(os.getenv('CASCADE_MIN_TEXT_CHARS', 20))
+
+
+def _hollow(text, min_chars=1):
+    text = text.strip()
+    return text.lower().rstrip('.') in PLACEHOLDERS or len(text) < min_chars
+
+
+def quality_problems(ccd):
+    """Reasons to distrust a diagram that passed validation, e.g. one from a cheaper model."""
+    problems = [f"{field} is empty or a placeholder" for field in TEXT_FIELDS
+                if _hollow(getattr(ccd, field), min_text_chars())]
+    for index, model in enumerate(ccd.cognitive_models):
+        problems.extend(f"cognitive model {index + 1} has no {field}" for field in MODEL_FIELDS
+                        if _hollow(getattr(model, field)))
+    situations = {model.situation.strip().lower() for model in ccd.cognitive_models}
+    if len(situations) < len(ccd.cognitive_models):
+        problems.append("cognitive models repeat a situation")
+    return problems
+
+
+def load_quality_check(spec=None):
+    """The quality check named `module:function` (default: CASCADE_QUALITY_CHECK or `quality_problems`).
+
+    It is called with a validated diagram and returns a list of problems;
+    any problem sends the transcript on to the next model.
+    """
+    spec = spec or os.getenv('CASCADE_QUALITY_CHECK')
+    if not spec:
+        return quality_problems
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def record_tier(model, outcome):
+    tier_stats[model]['tried'] += 1
+    tier_stats[model][outcome] += 1
+
+
+def log_tier_stats():
+    for model, stats in tier_stats.items():
+        logger.info(f"{model}: {stats['accepted']} of {stats['tried']} transcripts accepted "
+                    f"({stats['accepted'] / stats['tried']:.0%}), {stats['invalid']} invalid, "
+                    f"{stats['rejected']} rejected by the quality check, {stats['error']} errors")
@@ -0,0 +1,72 @@
+import json
+
+from generation.transcript import count_tokens, format_turns
+
+
+def split_windows(turns, max_tokens, overlap_tokens=0, abbreviate_speakers=False, model='gpt-4'):
+    """Split turns into token-bounded windows that overlap by up to `overlap_tokens`.
+
+    Windows always end on a turn boundary. A single turn longer than
+    `max_tokens` becomes a window of its own rather than being cut.
+    """
+    formatted = [format_turns([turn], abbreviate_speakers) for turn in turns]
+    # +1 for the newline that joins the turns
+    sizes = [count_tokens(turn, model) + 1 for turn in formatted]
+
+    windows = []
+    start = 0
+    while start < len(formatted):
+        end = start
+        total = 0
+        while end < len(formatted) and (end == start or total + sizes[end] <= max_tokens):
+            total += sizes[end]
+            end += 1
+        windows.append('\n'.join(formatted[start:end]))
+        if end >= len(formatted):
+            break
+
+        # Start the next window far enough back to repeat the tail of this one
+        overlap = 0
+        next_start = end
+        while next_start - 1 > start and overlap + sizes[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += sizes[next_start]
+        start = next_start
+    return windows
+
+
+def chunk_query(window, index, total, legend):
+    return "Below is excerpt {index} of {total} from a therapy session transcript. Note what it reveals about the patient following the below instructions. {legend}\n\n{window}".format(
+        index=index, total=total, legend=legend, window=window)
+
+
+def _key(text):
+    return ' '.join(text.lower().split())
+
+
+def merge_partials(partials):
+    """Concatenate partial conceptualizations, dropping repeats from overlapping windows."""
+    merged = {
+        "life_history": [],
+        "core_belief_candidates": [],
+        "intermediate_beliefs": [],
+        "coping_strategies": [],
+        "cognitive_models": [],
+    }
+    seen = {field: set() for field in merged}
+    for partial in partials:
+        for field, values in partial.model_dump().items():
+            if not isinstance(values, list):
+                values = [values] if values else []
+            for value in values:
+                key = _key(value["situation"]) if field == "cognitive_models" else _key(value)
+                if key in seen[field]:
+                    continue
+                seen[field].add(key)
+                merged[field].append(value)
+    return merged
+
+
+def reduce_query(merged, total):
+    return "Below are notes taken on {total} consecutive, overlapping excerpts of one therapy session transcript. Based on these notes, summarize the patient's personal history following the below instructions. Combine information that belongs together and drop duplicates, but do not invent anything the notes do not support.\n\n{notes}".format(
+        total=total, notes=json.dumps(merged, indent=1))
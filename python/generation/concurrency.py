@@ -0,0 +1,107 @@
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+from statistics import median, quantiles
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimit:
+    """Concurrency limit that adapts to the provider: additive increase, multiplicative decrease.
+
+    Used like an `asyncio.Semaphore`. While the limit is saturated and
+    requests come back healthy, it grows by one per `limit` completions.
+    A 429, timeout or overload reported through `overloaded`, or the last
+    few requests taking `latency_tolerance` times longer than the unloaded
+    latency (the 10th percentile of the window), multiplies it by `decrease`. Single slow outliers do not
+    count, and neither do requests sent before the last decrease, so that
+    one burst of trouble only counts once. Latencies are reported by the
+    request through `observe`, so that time spent waiting for rate limits
+    or backing off does not read as a slow provider.
+    """
+
+    def __init__(self, maximum, initial=None, minimum=1, decrease=0.5,
+                 latency_tolerance=2.0, window=100):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or max(maximum // 4, minimum))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.latencies = deque(maxlen=window)
+        self.recent = deque(maxlen=5)
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.last_decrease = 0.0
+        self.started = {}
+        self.observed = {}
+        self.stats = Counter()
+        self.lowest = self.highest = self.current
+
+    @property
+    def current(self):
+        """The limit in force, e.g. to export as a metric."""
+        return int(self.limit)
+
+    def _baseline(self):
+        if len(self.latencies) < 10:
+            return None
+        return quantiles(self.latencies, n=10)[0]
+
+    def _set(self, limit, reason):
+        before = self.current
+        self.limit = min(max(limit, self.minimum), self.maximum)
+        if self.current != before:
+            logger.info(f"Concurrency limit {before} -> {self.current} ({reason})")
+            self.lowest = min(self.lowest, self.current)
+            self.highest = max(self.highest, self.current)
+
+    def _decrease(self, reason):
+        now = time.monotonic()
+        if now - self.last_decrease < (self._baseline() or 1.0):
+            return
+        self.last_decrease = now
+        # Samples from before the decrease must not cause another one
+        self.recent.clear()
+        self.stats[f'decrease_{reason}'] += 1
+        self._set(self.limit * self.decrease, reason)
+
+    def overloaded(self, error):
+        """Report a 429, timeout or server error, e.g. as `RateLimiter.on_retry`."""
+        self._decrease(str(getattr(error, 'status_code', 'timeout')))
+
+    def observe(self, latency):
+        """Report the seconds the HTTP request of the current slot took."""
+        self.observed[asyncio.current_task()] = latency
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.current)
+            self.in_flight += 1
+            self.started[asyncio.current_task()] = (time.monotonic(), self.in_flight >= self.current)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        started, saturated = self.started.pop(asyncio.current_task())
+        # None when the slot sent no request, e.g. on a cache hit
+        latency = self.observed.pop(asyncio.current_task(), None)
+        baseline = self._baseline()
+        if latency is not None:
+            self.latencies.append(latency)
+            self.recent.append(latency)
+        if (latency is not None and baseline is not None and started > self.last_decrease
+                and len(self.recent) == self.recent.maxlen
+                and median(self.recent) > self.latency_tolerance * baseline):
+            self._decrease('latency')
+        elif exc is None and saturated:
+            self.stats['increase'] += 1
+            self._set(self.limit + 1 / self.limit, 'healthy')
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def log_stats(self):
+        decreases = ', '.join(f"{name[len('decrease_'):]}={count}"
+                              for name, count in sorted(self.stats.items())
+                              if name.startswith('decrease_'))
+        logger.info(f"Concurrency limit {self.current} (range {self.lowest}-{self.highest}, "
+                    f"maximum {self.maximum})" + (f", decreased on {decreases}" if decreases else ""))
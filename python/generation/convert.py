@@ -0,0 +1,120 @@
+from generation.generation_template import GenerationModel
+from generation.vocabulary import BELIEF_CATEGORY, CORE_BELIEFS, belief_label, emotion_label
+from generation.records import ProfileWriter
+from dotenv import load_dotenv
+from pydantic import ValidationError
+import os
+import json
+import glob
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+PATIENT_TYPES = ["plain", "verbose", "tangent", "upset", "reserved", "pleasing"]
+
+
+def ccd_to_profiles(ccd, patient_number, name, types):
+    """Explode one diagram into `PatientProfile` records, one per cognitive model."""
+    beliefs = {category: [] for category in CORE_BELIEFS}
+    for belief in ccd.core_belief_description:
+        beliefs[BELIEF_CATEGORY[belief]].append(belief_label(belief))
+
+    for index, cognitive_model in enumerate(ccd.cognitive_models, start=1):
+        yield {
+            "name": name,
+            "id": f"{patient_number}-{index}",
+            "type": list(types),
+            "history": ccd.life_history,
+            "helpless_belief": beliefs['helpless'],
+            "unlovable_belief": beliefs['unlovable'],
+            "worthless_belief": beliefs['worthless'],
+            "intermediate_belief": f"{ccd.intermediate_beliefs}\n[during depression]\n{ccd.intermediate_beliefs_during_depression}",
+            "coping_strategies": ccd.coping_strategies,
+            "situation": cognitive_model.situation,
+            "auto_thought": cognitive_model.automatic_thoughts,
+            "emotion": [emotion_label(emotion) for emotion in cognitive_model.emotion],
+            "behavior": cognitive_model.behavior,
+        }
+
+
+class IdMap:
+    """Remembers the patient number given to each diagram so reruns keep their ids."""
+
+    def __init__(self, path, start=1):
+        self.path = path
+        self.ids = {}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.ids = json.load(f)
+        self.next = max(self.ids.values(), default=start - 1) + 1
+
+    def get(self, source):
+        if source not in self.ids:
+            self.ids[source] = self.next
+            self.next += 1
+        return self.ids[source]
+
+    def save(self):
+        if self.path:
+            with open(self.path, 'w') as f:
+                json.dump(self.ids, f, indent=4, sort_keys=True)
+
+
+def convert(ccd_files, root, writer, id_map, default_name="Patient", types=PATIENT_TYPES):
+    skipped = 0
+    for ccd_file in ccd_files:
+        with open(os.path.join(root, ccd_file), 'r') as f:
+            data = json.load(f)
+        try:
+            # Revalidating also normalizes diagrams written before the
+            # vocabularies were enforced
+            ccd = GenerationModel.CognitiveConceptualizationDiagram.model_validate(data)
+        except ValidationError as e:
+            logger.warning(f"{ccd_file}: skipped, not a valid diagram: {e}")
+            skipped += 1
+            continue
+        name = data.get("name") or default_name
+        for profile in ccd_to_profiles(ccd, id_map.get(ccd_file), name, types):
+            writer.write(profile)
+    return skipped
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    base_path = os.path.dirname(os.path.abspath('.env'))
+    data_path = os.path.join(base_path, os.getenv('DATA_PATH', 'data'))
+    out_path = os.path.join(base_path, os.getenv('OUT_PATH', 'data'))
+
+    parser = argparse.ArgumentParser(
+        description="Convert generated diagrams into PatientProfile records for the app")
+    parser.add_argument('--ccd-dir', type=str, default='.',
+                        help="Directory of generated diagrams (relative to OUT_PATH)")
+    parser.add_argument('--glob', type=str, default='**/*_CCD.json')
+    parser.add_argument('--out-file', type=str, default='generated_profiles.json',
+                        help="Output file relative to DATA_PATH, `.jsonl` for JSON lines")
+    parser.add_argument('--id-map', type=str, default='profile_ids.json',
+                        help="File (relative to DATA_PATH) remembering the patient number of every diagram")
+    parser.add_argument('--start-id', type=int, default=1)
+    parser.add_argument('--name', type=str, default="Patient",
+                        help="Patient name for diagrams that do not carry one")
+    parser.add_argument('--types', type=str, default=','.join(PATIENT_TYPES),
+                        help="Comma-separated patient types every profile can be played as")
+    args = parser.parse_args()
+
+    root = os.path.join(out_path, args.ccd_dir)
+    ccd_files = sorted(os.path.relpath(path, root)
+                       for path in glob.glob(os.path.join(root, args.glob), recursive=True))
+    id_map = IdMap(os.path.join(data_path, args.id_map), args.start_id)
+
+    with ProfileWriter(os.path.join(data_path, args.out_file)) as writer:
+        skipped = convert(ccd_files, root, writer, id_map,
+                          args.name, args.types.split(','))
+    id_map.save()
+    logger.info(
+        f"Wrote {writer.count} profiles from {len(ccd_files) - skipped} diagrams to {args.out_file} ({skipped} skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,756 @@
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
-from generation.generation_template import GenerationModel
+from generation.cache import open_cache
+from generation.transcript import compact_transcript, format_turns, log_savings, prepare_turns, speaker_legend
+from generation.chunking import chunk_query, merge_partials, reduce_query, split_windows
+from generation.tracing import open_tracer, record_span, span
+from generation.ledger import open_ledger, recent_latencies, record_call
+from generation.hedging import Hedger, hedge_budget, hedge_percentile
+from generation.cascade import cascade_models, load_quality_check, log_tier_stats, record_tier
+from generation.manifest import file_hash, open_manifest
+from generation.concurrency import AdaptiveLimit
+from generation.ratelimit import RateLimiter, estimate_tokens, rate_limit_rpm, rate_limit_tpm
 from dotenv import load_dotenv
+from functools import lru_cache, partial
 import os
 import json
+import glob
+import time
+import asyncio
 import argparse
+import signal
 import logging
+from collections import Counter, defaultdict
 
-# Load dotenv
-load_dotenv()
+# langchain, openai and httpx take over a second to import, so they are only
+# imported once a generation starts. Keep `--help` and `import` cheap.
 
-# Ensure environment variables are set
-data_path_env = os.getenv('DATA_PATH')
-out_path_env = os.getenv('OUT_PATH')
+logger = logging.getLogger(__name__)
 
-if data_path_env is None or out_path_env is None:
-    raise ValueError("Environment variables DATA_PATH and OUT_PATH must be set.")
+OUTPUT_MODES = ('parser', 'structured')
 
-data_path = os.path.join(os.path.dirname(
-    os.path.abspath('.env')), data_path_env)
-out_path = os.path.join(os.path.dirname(
-    os.path.abspath('.env')), out_path_env)
+# Per output mode: requests sent, prompt tokens, first tries and how many of
+# them parsed without an LLM repair
+mode_stats = defaultdict(Counter)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def load_env():
+    load_dotenv()
+
+
+def env(name, default=None):
+    load_env()
+    return os.getenv(name, default)
+
+
+class Settings:
+    """Data and output paths, resolved from the environment on first use through `settings()`."""
+
+    def __init__(self):
+        data_path_env = env('DATA_PATH')
+        out_path_env = env('OUT_PATH')
+        if data_path_env is None or out_path_env is None:
+            raise ValueError("Environment variables DATA_PATH and OUT_PATH must be set.")
+        self.base_path = os.path.dirname(os.path.abspath('.env'))
+        self.data_path = os.path.join(self.base_path, data_path_env)
+        self.out_path = os.path.join(self.base_path, out_path_env)
+
+
+@lru_cache(maxsize=None)
+def settings():
+    return Settings()
+
+
+def max_attempts():
+    return int(env('MAX_ATTEMPTS', 3))
+
+
+def max_concurrency():
+    return int(env('MAX_CONCURRENCY', 8))
+
+
+def chunk_overlap_tokens():
+    return int(env('CHUNK_OVERLAP_TOKENS', 300))
+
+
+def output_mode():
+    return env('OUTPUT_MODE', 'parser')
+
+
+def tokenizer_model():
+    return env('GENERATOR_MODEL') or "gpt-4"
+
+
+def read_transcript(transcript_file):
+    with open(os.path.join(settings().data_path, transcript_file), 'r') as f:
+        return f.readlines()
+
+
+def build_query(transcript_file, abbreviate_speakers=False):
+    with span('read_transcript'):
+        lines = read_transcript(transcript_file)
+
+    with span('build_prompt'):
+        transcript = compact_transcript(
+            lines, transcript_file, abbreviate_speakers, tokenizer_model())
+    return "Based on the therapy session transcript, summarize the patient's personal history following the below instructions. {legend}\n\n{transcript}".format(
+        legend=speaker_legend(abbreviate_speakers), transcript=transcript)
+
+
+def build_llm(http_async_client=None, max_retries=2, model=None):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model or env('GENERATOR_MODEL') or "default_model",
+        temperature=float(env('GENERATOR_MODEL_TEMP', 0.7)),
+        max_retries=max_retries,
+        # Streamed responses still report their token usage
+        stream_usage=True,
+        http_async_client=http_async_client,
+    )
 
 
-def is_json_serializable(obj):
+def build_runnable(llm, pydantic_parser, mode='parser'):
+    if mode == 'structured':
+        return llm.with_structured_output(
+            pydantic_parser.pydantic_object, method="function_calling", include_raw=True)
+    return llm
+
+
+def response_text(result, mode='parser'):
+    if mode != 'structured':
+        return str(result.content)
+    if result['parsed'] is not None:
+        return result['parsed'].model_dump_json()
+    # Fall back to the raw tool arguments so they can still be repaired
+    tool_calls = result['raw'].additional_kwargs.get('tool_calls') or []
+    if tool_calls:
+        return tool_calls[0]['function']['arguments']
+    return str(result['raw'].content)
+
+
+def response_message(result, mode='parser'):
+    return result['raw'] if mode == 'structured' else result
+
+
+def used_tokens(result, mode='parser'):
+    usage = getattr(response_message(result, mode), 'usage_metadata', None) or {}
+    return usage.get('total_tokens', 0)
+
+
+def record_usage(result, mode='parser'):
+    usage = getattr(response_message(result, mode), 'usage_metadata', None) or {}
+    mode_stats[mode]['requests'] += 1
+    mode_stats[mode]['prompt_tokens'] += usage.get('input_tokens', 0)
+
+
+def cache_key(cache, llm, _input, tool_schema=None):
+    if cache is None:
+        return None
+    return cache.key(_input, llm, {"tool": tool_schema} if tool_schema else None)
+
+
+async def ainvoke_llm(runnable, _input, mode='parser'):
+    # Stream where the output is plain text so the first token can be timed
+    start_ns = time.time_ns()
+    with span('llm_request', mode=mode):
+        if mode == 'structured':
+            return await runnable.ainvoke(_input)
+        result = None
+        async for chunk in runnable.astream(_input):
+            if result is None:
+                record_span('first_token', start_ns, time.time_ns(), mode=mode)
+                result = chunk
+            else:
+                result += chunk
+        return result
+
+
+def lookup_cached(cache, key, refresh):
+    if key is None or refresh:
+        return None
+    with span('cache_lookup') as attributes:
+        response = cache.get(key)
+        attributes['hit'] = response is not None
+    if response is not None:
+        logger.info("Response cache hit")
+    return response
+
+
+async def ainvoke_cached(llm, _input, cache, refresh, runnable=None, tool_schema=None, mode='parser',
+                         transcript_file=None, attempt=0, limiter=None, on_latency=None,
+                         on_send=None):
+    """The response text, its cache key and whether it came from the cache.
+
+    `on_send` is called when the request goes out and `on_latency` with the
+    seconds the successful request took.
+    """
+    key = cache_key(cache, llm, _input, tool_schema)
+    response = lookup_cached(cache, key, refresh)
+    if response is not None:
+        record_call(llm, None, mode, transcript_file, attempt)
+        return response, key, True
+    limiter = limiter or RateLimiter(retries=0)
+    tokens = estimate_tokens(_input, tokenizer_model())
+    start = None
+
+    async def request():
+        # Latency of the request that got through, without time spent queueing
+        nonlocal start
+        if on_send is not None:
+            on_send()
+        start = time.perf_counter()
+        return await ainvoke_llm(runnable or llm, _input, mode)
+
     try:
-        json.dumps(obj)
+        result = await limiter.acall(request, tokens)
+    except asyncio.CancelledError:
+        # A hedged duplicate answered first
+        record_call(llm, None, mode, transcript_file, attempt,
+                    (time.perf_counter() - start) * 1000 if start else 0.0, cancelled=True)
+        raise
+    latency = time.perf_counter() - start
+    limiter.settle(tokens, used_tokens(result, mode))
+    record_call(llm, response_message(result, mode), mode, transcript_file, attempt, latency * 1000)
+    record_usage(result, mode)
+    if on_latency is not None:
+        on_latency(latency)
+    return response_text(result, mode), key, False
+
+
+def log_mode_stats():
+    for mode, stats in sorted(mode_stats.items()):
+        if not stats['requests']:
+            continue
+        summary = (f"{mode} mode: {stats['requests']} requests, "
+                   f"{stats['prompt_tokens'] / stats['requests']:.0f} prompt tokens per request")
+        if stats['first_tries']:
+            summary += f", {stats['first_try_valid'] / stats['first_tries']:.0%} valid on the first try"
+        logger.info(summary)
+
+
+def store_cached(cache, key, llm, response):
+    if cache is not None:
+        cache.put(key, llm.model_name, response)
+
+
+def write_output(_output, out_file):
+    out_file_path = os.path.join(settings().out_path, out_file)
+    os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
+    with span('write_output'), open(out_file_path, 'w') as f:
+        f.write(json.dumps(_output, indent=4))
+    logger.info(f"Output successfully written to {out_file}")
+
+
+def _next_mode(mode, result, attempts, transcript_file, cached=False):
+    # Cached responses were already counted when they were first generated
+    if attempts == 0 and not cached:
+        mode_stats[mode]['first_tries'] += 1
+        mode_stats[mode]['first_try_valid'] += result is not None
+    if result is None and mode == 'structured':
+        logger.warning(
+            f"{transcript_file}: structured output failed, falling back to parser mode")
+        return 'parser'
+    return mode
+
+
+class CCDGenerator:
+    """Generates diagrams from transcripts with one parser, prompt and connection pool.
+
+    Build it once per run: the schema is rendered into the prompt once, and
+    all requests share keep-alive HTTP connections to the API. The sync
+    methods run the async ones on a private event loop.
+    """
+
+    def __init__(self, cache=None, refresh=False, abbreviate_speakers=False,
+                 chunk_tokens=None, mode='parser', concurrency=None, limiter=None,
+                 concurrency_limit=None, hedger=None, cascade=None, quality_check=None):
+        import httpx
+        from langchain_core.output_parsers import PydanticOutputParser
+        from openai import DefaultAsyncHttpxClient
+        from generation.generation_template import GenerationModel
+
+        load_env()
+        self.cache = cache
+        self.refresh = refresh
+        self.abbreviate_speakers = abbreviate_speakers
+        self.chunk_tokens = chunk_tokens
+        self.mode = mode
+        self.hedger = hedger
+        concurrency = concurrency or max_concurrency()
+        self.concurrency = concurrency
+        # Retries go through the limiter so that they respect the rate limits too
+        self.limiter = limiter or RateLimiter(rate_limit_rpm(), rate_limit_tpm())
+
+        self.pydantic_parser = PydanticOutputParser(
+            pydantic_object=GenerationModel.CognitiveConceptualizationDiagram)
+        self.partial_parser = PydanticOutputParser(
+            pydantic_object=GenerationModel.PartialConceptualization)
+        self.prompts = {
+            'parser': GenerationModel.prompt_template.partial(
+                format_instructions=self.pydantic_parser.get_format_instructions()),
+            # In structured mode the schema travels as a tool definition instead
+            'structured': GenerationModel.structured_prompt_template,
+            'chunk': GenerationModel.chunk_prompt_template.partial(
+                format_instructions=self.partial_parser.get_format_instructions()),
+        }
+        self.tool_schema = self.pydantic_parser.pydantic_object.model_json_schema()
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self.http_async_client = DefaultAsyncHttpxClient(limits=limits)
+        self.llm = build_llm(http_async_client=self.http_async_client, max_retries=0)
+        self.runnables = {runnable_mode: build_runnable(self.llm, self.pydantic_parser, runnable_mode)
+                          for runnable_mode in OUTPUT_MODES}
+        # Cheaper models tried first, each with one attempt, before `self.llm`
+        self.tiers = []
+        for model in cascade or []:
+            llm = build_llm(http_async_client=self.http_async_client, max_retries=0,
+                            model=model)
+            self.tiers.append((llm, build_runnable(llm, self.pydantic_parser, mode)))
+        self.quality_check = quality_check or load_quality_check()
+        # An `AdaptiveLimit` instead of a fixed one backs off when the provider struggles
+        self.semaphore = concurrency_limit or asyncio.Semaphore(concurrency)
+        self.concurrency_limit = concurrency_limit
+        if concurrency_limit is not None:
+            self.limiter.on_retry = concurrency_limit.overloaded
+        self._loop = None
+
+    def render_input(self, query, mode):
+        with span('render_prompt', mode=mode):
+            return self.prompts[mode].invoke({"query": query})
+
+    def _run(self, coroutine):
+        # Sync callers reuse one loop so pooled async connections stay usable
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    async def aquery(self, transcript_file):
+        if self.chunk_tokens:
+            return await self.achunked_query(transcript_file)
+        return build_query(transcript_file, self.abbreviate_speakers)
+
+    async def achunked_query(self, transcript_file):
+        from langchain_core.exceptions import OutputParserException
+        from generation.json_repair import parse_with_repair
+
+        # Map: extract partial conceptualizations from overlapping windows
+        # concurrently. Reduce: merge them into the query for the full diagram.
+        with span('read_transcript'):
+            lines = read_transcript(transcript_file)
+        with span('build_prompt', mode='chunk'):
+            turns = prepare_turns(lines)
+            log_savings(lines, format_turns(turns, self.abbreviate_speakers),
+                        transcript_file, tokenizer_model())
+            windows = split_windows(turns, self.chunk_tokens, chunk_overlap_tokens(),
+                                    self.abbreviate_speakers, tokenizer_model())
+        logger.info(
+            f"{transcript_file}: split into {len(windows)} windows of at most {self.chunk_tokens} tokens")
+        legend = speaker_legend(self.abbreviate_speakers)
+
+        async def extract(index, window):
+            _input = self.render_input(
+                chunk_query(window, index + 1, len(windows), legend), 'chunk')
+            attempts = 0
+            while True:
+                async with self.semaphore:
+                    response, key, _ = await ainvoke_cached(
+                        self.llm, _input, self.cache, self.refresh or attempts > 0, mode='chunk',
+                        transcript_file=transcript_file, attempt=attempts, limiter=self.limiter,
+                        on_latency=self._observe)
+                with span('parse', mode='chunk', concurrency_limit=self._concurrency_limit()):
+                    partial, response = parse_with_repair(
+                        self.partial_parser, response, transcript_file)
+                if partial is None:
+                    attempts += 1
+                    if attempts >= max_attempts():
+                        raise OutputParserException(
+                            f"Could not parse window {index + 1} of {transcript_file}")
+                    logger.warning(
+                        f"{transcript_file}: window {index + 1} could not be parsed. Attempting {attempts}/{max_attempts()}")
+                    continue
+                store_cached(self.cache, key, self.llm, response)
+                return partial
+
+        partials = await asyncio.gather(*[
+            extract(index, window) for index, window in enumerate(windows)])
+
+        return reduce_query(merge_partials(partials), len(windows))
+
+    def _concurrency_limit(self):
+        # Recorded on every request's spans so the limit can be charted over a run
+        if self.concurrency_limit is not None:
+            return self.concurrency_limit.current
+        return self.concurrency
+
+    def _observe(self, latency, racer=None):
+        if self.concurrency_limit is not None:
+            self.concurrency_limit.observe(latency)
+        if racer is not None:
+            racer.latency = latency
+
+    def _tool_schema(self, mode):
+        return self.tool_schema if mode == 'structured' else None
+
+    def _accept(self, llm, result, transcript_file):
+        model = llm.model_name
+        if result is None:
+            record_tier(model, 'invalid')
+            logger.info(f"{transcript_file}: {model} gave no valid diagram, escalating")
+            return False
+        problems = self.quality_check(result)
+        if problems:
+            record_tier(model, 'rejected')
+            logger.info(f"{transcript_file}: {model} diagram rejected ({'; '.join(problems)}), escalating")
+            return False
+        record_tier(model, 'accepted')
         return True
-    except (TypeError, OverflowError):
-        return False
 
+    async def _acascade(self, transcript_file, query):
+        """The first diagram of a cheaper model that validates and passes the quality check, or None."""
+        import openai
+        from generation.json_repair import parse_with_repair
 
-def generate_chain(transcript_file, out_file):
-    with open(os.path.join(data_path, transcript_file), 'r') as f:
-        lines = f.readlines()
+        _input = self.render_input(query, self.mode)
+        for llm, runnable in self.tiers:
+            try:
+                async with self.semaphore:
+                    response, key, _ = await ainvoke_cached(
+                        llm, _input, self.cache, self.refresh, runnable, self._tool_schema(self.mode),
+                        self.mode, transcript_file, 0, self.limiter, self._observe)
+            except openai.APIError as e:
+                # Includes connection errors and timeouts the limiter's retries gave
+                # up on; the next model may be up. Anything else is a bug and raises.
+                record_tier(llm.model_name, 'error')
+                logger.warning(f"{transcript_file}: {llm.model_name} failed with {e!r}, escalating")
+                continue
+            with span('parse', mode=self.mode, model=llm.model_name,
+                      concurrency_limit=self._concurrency_limit()):
+                result, response = parse_with_repair(self.pydantic_parser, response, transcript_file)
+            if self._accept(llm, result, transcript_file):
+                store_cached(self.cache, key, llm, response)
+                return result
+        return None
 
-    query = "Based on the therapy session transcript, summarize the patient's personal history following the below instructions. Not that `Client` means the patient in the transcript.\n\n{lines}".format(
-        lines=lines)
+    def _finish(self, result, out_file, final_tier=True):
+        if self.tiers and final_tier:
+            record_tier(self.llm.model_name, 'accepted' if result is not None else 'invalid')
+        if result is None:
+            raise ValueError(
+                "Could not generate a valid output after maximum attempts.")
+        if out_file:
+            write_output(result.model_dump(), out_file)
+        return result
 
-    pydantic_parser = PydanticOutputParser(
-        pydantic_object=GenerationModel.CognitiveConceptualizationDiagram)
+    def generate(self, transcript_file, out_file=None):
+        """Generate the diagram of one transcript, writing it to `out_file` if given."""
+        with span('generate', new_trace=True, transcript=transcript_file):
+            return self._run(self._agenerate(transcript_file, out_file))
 
-    _input = GenerationModel.prompt_template.invoke({
-        "query": query,
-        "format_instructions": pydantic_parser.get_format_instructions()
-    })
-    llm = ChatOpenAI(
-        model=os.getenv('GENERATOR_MODEL') or "default_model",
-        temperature=float(os.getenv('GENERATOR_MODEL_TEMP', 0.7)),
-        max_retries=2,
-    )
-    attempts = 0
-
-    while attempts < int(os.getenv('MAX_ATTEMPTS', 3)):
-        _output = pydantic_parser.parse(
-            str(llm.invoke(_input).content)).model_dump()
-        print(_output)
-        if is_json_serializable(_output):
-            with open(os.path.join(out_path, out_file), 'w') as f:
-                f.write(json.dumps(_output, indent=4))
-            logger.info(f"Output successfully written to {out_file}")
-            break
-        else:
+    async def agenerate(self, transcript_file, out_file=None):
+        """Async `generate`, with at most `concurrency` requests in flight across calls."""
+        with span('generate', new_trace=True, transcript=transcript_file):
+            return await self._agenerate(transcript_file, out_file)
+
+    async def _agenerate(self, transcript_file, out_file):
+        from generation.json_repair import parse_with_repair
+        from generation.repair import arepair_output
+
+        query = await self.aquery(transcript_file)
+        if self.tiers:
+            result = await self._acascade(transcript_file, query)
+            if result is not None:
+                return self._finish(result, out_file, final_tier=False)
+        mode = self.mode
+        attempts = 0
+
+        while attempts < max_attempts():
+            _input = self.render_input(query, mode)
+
+            async def request(racer=None, _input=_input, mode=mode, attempts=attempts):
+                # A hedged duplicate must not be answered from the cache
+                hedged = racer is not None and racer.role == 'hedge'
+                async with self.semaphore:
+                    response, key, cached = await ainvoke_cached(
+                        self.llm, _input, self.cache, self.refresh or attempts > 0 or hedged,
+                        self.runnables[mode], self._tool_schema(mode), mode, transcript_file,
+                        attempts, self.limiter, partial(self._observe, racer=racer),
+                        racer.sent.set if racer is not None else None)
+                with span('parse', mode=mode, hedged=hedged,
+                          concurrency_limit=self._concurrency_limit()):
+                    result, response = parse_with_repair(
+                        self.pydantic_parser, response, transcript_file)
+                return result, response, key, cached
+
+            if self.hedger is None:
+                result, response, key, cached = await request()
+            else:
+                result, response, key, cached = await self.hedger.race(
+                    request, lambda outcome: outcome[0] is not None)
+            next_mode = _next_mode(mode, result, attempts, transcript_file, cached)
+            if result is None:
+                with span('repair'):
+                    result = await arepair_output(
+                        self.pydantic_parser.pydantic_object, response, self.llm,
+                        transcript_file, self.semaphore, self.limiter, self._observe)
+                if result is not None:
+                    response = result.model_dump_json()
+            if result is not None:
+                store_cached(self.cache, key, self.llm, response)
+                return self._finish(result, out_file)
+            mode = next_mode
             attempts += 1
             logger.warning(
-                f"Output is not JSON serializable. Attempting {attempts}/{int(os.getenv('MAX_ATTEMPTS', 3))}")
-            if attempts == int(os.getenv('MAX_ATTEMPTS', 3)):
-                logger.error(
-                    "Max attempts reached. Could not generate a JSON serializable output.")
-                raise ValueError(
-                    "Could not generate a JSON serializable output after maximum attempts.")
+                f"{transcript_file}: output could not be parsed or repaired. Attempting {attempts}/{max_attempts()}")
+
+        logger.error(
+            f"{transcript_file}: max attempts reached. Could not generate a valid output.")
+        return self._finish(None, out_file)
+
+    def close(self):
+        self._run(self.http_async_client.aclose())
+        self._loop.close()
+        self._loop = None
+
+    async def aclose(self):
+        await self.http_async_client.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+def generate_chain(transcript_file, out_file, cache=None, refresh=False,
+                   abbreviate_speakers=False, chunk_tokens=None, mode='parser', limiter=None,
+                   hedger=None, cascade=None, quality_check=None):
+    from generation.json_repair import log_repair_stats
+
+    with CCDGenerator(cache, refresh, abbreviate_speakers, chunk_tokens, mode,
+                      limiter=limiter, hedger=hedger, cascade=cascade,
+                      quality_check=quality_check) as generator:
+        result = generator.generate(transcript_file, out_file)
+    print(result.model_dump())
+    log_repair_stats()
+    log_mode_stats()
+    log_tier_stats()
+    generator.limiter.log_stats()
+    if hedger is not None:
+        hedger.log_stats()
+
+
+def out_file_for(transcript_file):
+    stem, _ = os.path.splitext(transcript_file)
+    return f"{stem}_CCD.json"
+
+
+def find_transcripts(transcript_dir, pattern):
+    data_path = settings().data_path
+    root = os.path.join(data_path, transcript_dir)
+    matches = glob.glob(os.path.join(root, pattern), recursive=True)
+    return sorted(os.path.relpath(path, data_path)
+                  for path in matches if os.path.isfile(path))
+
+
+def pending_transcripts(transcript_files, manifest):
+    """Content hashes of the transcripts that still need a run, skipping completed ones."""
+    pending = {}
+    for transcript_file in transcript_files:
+        content_hash = file_hash(os.path.join(settings().data_path, transcript_file))
+        out_exists = os.path.exists(os.path.join(settings().out_path, out_file_for(transcript_file)))
+        if not (out_exists and manifest.is_done(transcript_file, content_hash)):
+            pending[transcript_file] = content_hash
+    return pending
+
+
+async def generate_batch(transcript_files, concurrency, cache=None, refresh=False,
+                         abbreviate_speakers=False, chunk_tokens=None, mode='parser',
+                         manifest=None, resume=True, limiter=None, concurrency_limit=None,
+                         hedger=None, cascade=None, quality_check=None):
+    from generation.json_repair import log_repair_stats
+
+    hashes = {}
+    if manifest is not None:
+        hashes = pending_transcripts(transcript_files, manifest) if resume else {
+            transcript_file: file_hash(os.path.join(settings().data_path, transcript_file))
+            for transcript_file in transcript_files}
+        if len(hashes) < len(transcript_files):
+            logger.info(f"Skipping {len(transcript_files) - len(hashes)} transcripts completed "
+                        f"in an earlier run")
+        transcript_files = [f for f in transcript_files if f in hashes]
+
+    # On Ctrl+C, start no new transcripts but let the running ones finish and
+    # reach the manifest. A second Ctrl+C aborts right away.
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+
+    def request_stop():
+        logger.warning("Interrupted: finishing in-flight transcripts, press Ctrl+C again to abort")
+        stopping.set()
+        loop.remove_signal_handler(signal.SIGINT)
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, request_stop)
+        handles_sigint = True
+    except (NotImplementedError, RuntimeError, ValueError):
+        # No signal handlers on Windows event loops or outside the main thread
+        handles_sigint = False
+
+    # Only as many transcripts in flight as requests, so an interrupt has little to drain
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(generator, transcript_file):
+        async with slots:
+            if stopping.is_set():
+                return False
+            if manifest is not None:
+                manifest.start(transcript_file, hashes[transcript_file], out_file_for(transcript_file))
+            try:
+                await generator.agenerate(transcript_file, out_file_for(transcript_file))
+            except Exception as e:
+                if manifest is not None:
+                    manifest.fail(transcript_file, e)
+                raise
+            if manifest is not None:
+                manifest.finish(transcript_file)
+            return True
+
+    try:
+        async with CCDGenerator(cache, refresh, abbreviate_speakers, chunk_tokens,
+                                mode, concurrency, limiter, concurrency_limit, hedger,
+                                cascade, quality_check) as generator:
+            results = await asyncio.gather(*[
+                run(generator, transcript_file) for transcript_file in transcript_files
+            ], return_exceptions=True)
+    finally:
+        if handles_sigint:
+            loop.remove_signal_handler(signal.SIGINT)
+
+    failed = [(transcript_file, result)
+              for transcript_file, result in zip(transcript_files, results)
+              if isinstance(result, BaseException)]
+    not_started = sum(result is False for result in results)
+    log_repair_stats()
+    log_mode_stats()
+    log_tier_stats()
+    generator.limiter.log_stats()
+    if concurrency_limit is not None:
+        concurrency_limit.log_stats()
+    if hedger is not None:
+        hedger.log_stats()
+    for transcript_file, error in failed:
+        logger.error(f"{transcript_file}: generation failed: {error!r}")
+    logger.info(
+        f"Batch finished: {len(transcript_files) - len(failed) - not_started} succeeded, "
+        f"{len(failed)} failed")
+    if stopping.is_set():
+        logger.warning(f"Stopped before starting {not_started} transcripts. "
+                       f"Run the same command again to resume.")
+        # The exit code of a shell job killed by SIGINT
+        raise SystemExit(130)
+    return failed
 
 
 def main():
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument('--transcript-file', type=str,
                         default="example_transcript.txt")
     parser.add_argument('--out-file', type=str,
                         default="example_CCD_from_transcript.json")
+    parser.add_argument('--transcript-dir', type=str, default=None,
+                        help="Process every transcript in this directory (relative to DATA_PATH)")
+    parser.add_argument('--glob', type=str, default=None,
+                        help="Pattern of transcripts to process in batch mode (default: *.txt)")
+    parser.add_argument('--concurrency', type=int,
+                        default=max_concurrency(),
+                        help="Maximum number of in-flight requests in batch mode")
+    parser.add_argument('--adaptive-concurrency', action='store_true',
+                        default=bool(env('ADAPTIVE_CONCURRENCY')),
+                        help="Start below --concurrency and adapt the limit to the provider's latency and errors")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Neither read nor write the response cache")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Ignore cached responses but store the new ones")
+    parser.add_argument('--abbreviate-speakers', action='store_true',
+                        help="Shorten `Therapist:`/`Client:` tags to `T:`/`C:` in the prompt")
+    parser.add_argument('--chunk-tokens', type=int, default=None,
+                        help="Extract from overlapping windows of at most this many tokens and merge the results")
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default=output_mode(),
+                        help="`structured` passes the schema as a tool instead of format instructions")
+    parser.add_argument('--manifest', type=str, default=None,
+                        help="Batch checkpoint to resume from (default: MANIFEST_PATH or .cache/manifest.sqlite)")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="Regenerate transcripts the manifest records as done")
+    parser.add_argument('--hedge-percentile', type=float, default=None,
+                        help="Send a duplicate request when one runs longer than this percentile "
+                             "of recent latency, e.g. 95 (default: HEDGE_PERCENTILE, off)")
+    parser.add_argument('--hedge-budget', type=float, default=None,
+                        help="Duplicates allowed per request (default: HEDGE_BUDGET or 0.1)")
+    parser.add_argument('--cascade', type=str, default=None,
+                        help="Comma-separated cheaper models to try before GENERATOR_MODEL "
+                             "(default: CASCADE_MODELS, off)")
+    parser.add_argument('--quality-check', type=str, default=None, metavar='MODULE:FUNCTION',
+                        help="Check that decides whether a cheaper model's diagram is kept "
+                             "(default: CASCADE_QUALITY_CHECK or the built-in check)")
+    parser.add_argument('--rpm', type=int, default=None,
+                        help="Requests per minute to stay under (default: RATE_LIMIT_RPM, unlimited)")
+    parser.add_argument('--tpm', type=int, default=None,
+                        help="Tokens per minute to stay under (default: RATE_LIMIT_TPM, unlimited)")
     args = parser.parse_args()
-    generate_chain(args.transcript_file, args.out_file)
+
+    cache = None if args.no_cache else open_cache(settings().base_path)
+    load_env()
+    limiter = RateLimiter(rate_limit_rpm() if args.rpm is None else args.rpm,
+                          rate_limit_tpm() if args.tpm is None else args.tpm)
+    open_tracer(settings().base_path)
+    ledger = open_ledger(settings().base_path)
+    if ledger is not None:
+        logger.info(f"Recording calls to the ledger as run {ledger.run_id}")
+    cascade = cascade_models(args.cascade)
+    quality_check = load_quality_check(args.quality_check)
+    hedger = None
+    percentile = hedge_percentile() if args.hedge_percentile is None else args.hedge_percentile
+    if percentile:
+        # Earlier runs in the ledger tell what a slow request is from the start
+        hedger = Hedger(percentile, hedge_budget() if args.hedge_budget is None else args.hedge_budget,
+                        recent_latencies(env('GENERATOR_MODEL') or "default_model", args.output_mode))
+
+    if args.transcript_dir is None and args.glob is None:
+        generate_chain(args.transcript_file, args.out_file,
+                       cache, args.refresh, args.abbreviate_speakers,
+                       args.chunk_tokens, args.output_mode, limiter, hedger, cascade,
+                       quality_check)
+        return
+
+    transcript_files = find_transcripts(
+        args.transcript_dir or '.', args.glob or '*.txt')
+    if not transcript_files:
+        logger.warning("No transcripts matched, nothing to do.")
+        return
+    logger.info(
+        f"Generating {len(transcript_files)} transcripts with concurrency {args.concurrency}")
+    manifest = open_manifest(settings().base_path, args.manifest)
+    try:
+        failed = asyncio.run(generate_batch(
+            transcript_files, args.concurrency, cache, args.refresh,
+            args.abbreviate_speakers, args.chunk_tokens, args.output_mode,
+            manifest, not args.no_resume, limiter,
+            AdaptiveLimit(args.concurrency) if args.adaptive_concurrency else None, hedger,
+            cascade, quality_check))
+    finally:
+        counts = manifest.counts(transcript_files)
+        logger.info(f"Manifest {manifest.path}: " + ', '.join(
+            f"{count} {status}" for status, count in sorted(counts.items())))
+        manifest.close()
+    if failed:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
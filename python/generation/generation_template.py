@@ -1,6 +1,7 @@
 from typing import List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from langchain_core.prompts import ChatPromptTemplate
+from generation.vocabulary import BELIEF_CATEGORY, CoreBeliefCategories, CoreBeliefDescriptions, Emotions
 
 
 class CognitiveModel(BaseModel):
@@ -10,8 +11,10 @@ class CognitiveModel(BaseModel):
     automatic_thoughts: str = Field(
         ...,
         description="These are spontaneous thoughts that occur in response to a situation, often without conscious control. Examples: `What if I run out of money?`, `I should be able to do this on my own.`, `I should have tried harder.`")
-    emotion: str = Field(
+    emotion: Emotions = Field(
         ...,
+        min_length=1,
+        max_length=3,
         description="The feelings or emotions that arise in response to the automatic thoughts. You must pick at most three of the emotions in this set: `sad/down/lonely/unhappy`, `anxious/worried/fearful/scared/tense`, `angry/mad/irritated/annoyed`, `ashamed/humiliated/embarrassed`, `disappointed`, `jealous/envious`, `guilty`, `hurt`, `suspicious`.")
     behavior: str = Field(
         ...,
@@ -24,15 +27,49 @@ class GenerationModel:
         ('user', '{query}\n\nFormat instructions:\n{format_instructions}You should follow the concepts of cognitive behavioral therapy and figure out the cognitive behavioral model of the patient from a therapy session.')
     ])
 
+    structured_prompt_template = ChatPromptTemplate.from_messages([
+        ('system', 'You are a CBT therapist who is professional and empathetic. Now you just ended a therapy session with a patient. Your goal is to reconstruct the cognitive model of the patient based on your conversations.'),
+        ('user', '{query}\n\nYou should follow the concepts of cognitive behavioral therapy and figure out the cognitive behavioral model of the patient from a therapy session. Report it by calling the provided function.')
+    ])
+
+    chunk_prompt_template = ChatPromptTemplate.from_messages([
+        ('system', 'You are a CBT therapist who is professional and empathetic. You are reviewing one excerpt of a longer therapy session with a patient. Your goal is to note everything in this excerpt that reveals the cognitive model of the patient.'),
+        ('user', '{query}\n\nFormat instructions:\n{format_instructions}Only report what this excerpt supports. Leave a field empty if the excerpt says nothing about it.')
+    ])
+
+    repair_prompt_template = ChatPromptTemplate.from_messages([
+        ('system', 'You are a CBT therapist who is professional and empathetic. You are completing a cognitive conceptualization diagram of a patient that you have partly written already.'),
+        ('user', 'This is the part of the diagram that is already complete:\n{valid}\n\nThe following fields are missing or invalid:\n{errors}\n\nWrite only these fields so that they are consistent with the rest of the diagram.\n\nFormat instructions:\n{format_instructions}')
+    ])
+
+    class PartialConceptualization(BaseModel):
+        life_history: str = Field(
+            "",
+            description="Background information about the patient revealed in this excerpt, such as significant life events or circumstances. Empty if the excerpt reveals none.")
+        core_belief_candidates: List[str] = Field(
+            default_factory=list,
+            description="Core beliefs the patient seems to hold in this excerpt, phrased like `I am incompetent` or `I am unlovable`.")
+        intermediate_beliefs: str = Field(
+            "",
+            description="Attitudes, rules and assumptions of the patient revealed in this excerpt, including those active during depression. Empty if none.")
+        coping_strategies: str = Field(
+            "",
+            description="Methods the patient uses in this excerpt to deal with stress or difficult emotions. Empty if none.")
+        cognitive_models: List[CognitiveModel] = Field(
+            default_factory=list,
+            description="Every distinct cognitive model (situation, automatic thoughts, emotion, behavior) discussed in this excerpt.")
+
     class CognitiveConceptualizationDiagram(BaseModel):
         life_history: str = Field(
             ...,
             description="This field is intended to capture important background information about the patient, such as significant life events or circumstances that may have contributed to their current mental state or behavior.")
-        core_beliefs: str = Field(
+        core_beliefs: CoreBeliefCategories = Field(
             ...,
+            min_length=1,
             description="Core beliefs are fundamental, deeply held beliefs that a person has about themselves, others, or the world. These are often central to a person's identity and worldview, and in CBT, are considered to influence how they interpret experiences. You must choose at least one core belief category from the 3 buckets: `Helpless belief`, `Unlovable belief`, and `Worthless belief`")
-        core_belief_description: str = Field(
+        core_belief_description: CoreBeliefDescriptions = Field(
             ...,
+            min_length=1,
             description="Given the core belief you have choose, pick one or more of the descriptions from the selected core belief category: If it is Helpless belief, pick at least one from `I am helpless`, `I am incompetent`, `I am powerless, weak, vulnerable`, `I am a victim`, `I am needy`, `I am trapped`, `I am out of control`, I am a failure, a loser`, `I am defective`. If it is Unlovable belief, pick at least one from `I am unlovable`, `I am unattractive`, `I am undesired, unwanted`, `I am bound to be rejected`, `I am bound to be abandoned`, `I am bound to be alone`. If it is Worthless belief, pick at least one from `I am worthless, a waste`, `I am immoral`, `I am bad - dangerous, toxic, evil`, `I don't deserve to live`.")
         intermediate_beliefs: str = Field(
             ...,
@@ -45,4 +82,13 @@ class GenerationModel:
             description="Coping strategies are the methods a person uses to deal with stress or difficult emotions. This could include both healthy strategies (like exercise, seeking social support) and unhealthy ones (like substance abuse, avoidance).")
         cognitive_models: List[CognitiveModel] = Field(
             ...,
+            min_length=3,
             description="You must provide at least 3 distinct cognitive models based on the instructions.")
+
+        @model_validator(mode='after')
+        def add_implied_categories(self):
+            # A description implies its category even if the model forgot to pick it
+            for belief in self.core_belief_description:
+                if BELIEF_CATEGORY[belief] not in self.core_beliefs:
+                    self.core_beliefs.append(BELIEF_CATEGORY[belief])
+            return self
@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+from collections import Counter, deque
+
+from generation.ledger import current_racer, record_race
+from generation.tracing import percentile
+
+logger = logging.getLogger(__name__)
+
+# Without this many latencies there is no telling what slow is, so no hedging
+MIN_HISTORY = 20
+
+
+def hedge_percentile():
+    return float(os.getenv('HEDGE_PERCENTILE') or 0)
+
+
+def hedge_budget():
+    return float(os.getenv('HEDGE_BUDGET', 0.1))
+
+
+class Racer:
+    """One contestant of a hedged race, the ledger rows of its calls and its request latency."""
+
+    def __init__(self, role):
+        self.role = role
+        self.row_ids = []
+        # Set once the request is sent, after it got a slot and rate limit tokens
+        self.sent = asyncio.Event()
+        self.latency = None
+
+
+class Hedger:
+    """Duplicates requests that run longer than a percentile of recent latency.
+
+    The first valid answer wins and the other request is cancelled. At most
+    `budget` duplicates per request are sent (plus one, so that a single
+    interactive generation can be hedged), which caps the extra cost.
+    """
+
+    def __init__(self, percentile=95, budget=0.1, history=()):
+        self.fraction = percentile / 100
+        self.budget = budget
+        self.latencies = deque(history, maxlen=200)
+        self.stats = Counter()
+
+    def delay(self):
+        """Seconds to wait for the primary before hedging, or None while the history is too short."""
+        if len(self.latencies) < MIN_HISTORY:
+            return None
+        return percentile(sorted(self.latencies), self.fraction) / 1000
+
+    def _may_hedge(self):
+        return self.stats['hedges'] < self.budget * self.stats['requests'] + 1
+
+    async def _run(self, racer, attempt):
+        current_racer.set(racer)
+        return await attempt(racer)
+
+    async def _sent(self, racer, task):
+        # A request answered from the cache or failing early is never sent
+        sent = asyncio.create_task(racer.sent.wait())
+        try:
+            await asyncio.wait({task, sent}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sent.cancel()
+
+    async def race(self, attempt, valid):
+        """Run `attempt(racer)` and maybe a duplicate; return the first result `valid` accepts.
+
+        `attempt` sets `racer.sent` when its request goes out and records the
+        provider's latency in `racer.latency`; the delay before hedging starts
+        only then, so requests still queued for capacity are not duplicated.
+        If neither result is valid, the primary's result (or error) is returned.
+        """
+        self.stats['requests'] += 1
+        primary = Racer('primary')
+        primary_task = asyncio.create_task(self._run(primary, attempt))
+        tasks = {primary_task: primary}
+        delay = self.delay()
+        if delay is not None:
+            await self._sent(primary, primary_task)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._may_hedge():
+                self.stats['hedges'] += 1
+                logger.info(f"No answer after {delay:.1f}s, sending a hedged request")
+                hedge = Racer('hedge')
+                tasks[asyncio.create_task(self._run(hedge, attempt))] = hedge
+
+        winner = None
+        pending = set(tasks)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and valid(task.result()):
+                        winner = task
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        self.latencies.extend(racer.latency * 1000 for racer in tasks.values()
+                              if racer.latency is not None)
+        if len(tasks) > 1:
+            if winner is not None and tasks[winner].role == 'hedge':
+                self.stats['hedge_wins'] += 1
+            record_race(tasks.values(), tasks[winner] if winner is not None else None)
+        return (winner or primary_task).result()
+
+    def log_stats(self):
+        if not self.stats['requests']:
+            return
+        logger.info(f"Hedging: {self.stats['hedges']} of {self.stats['requests']} requests hedged, "
+                    f"{self.stats['hedge_wins']} won by the hedge")
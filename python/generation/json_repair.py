@@ -0,0 +1,165 @@
+import json
+import logging
+from collections import Counter
+
+from langchain_core.exceptions import OutputParserException
+
+logger = logging.getLogger(__name__)
+
+# How often each rule fired, plus `saved_retries` for the responses it rescued
+repair_stats = Counter()
+
+OPENING_QUOTES = '“„'
+CLOSING_QUOTES = '”'
+SMART_QUOTES = OPENING_QUOTES + CLOSING_QUOTES
+CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+def _strip_fences(text, fired):
+    start = text.find('{')
+    if start == -1:
+        return text
+    stripped = text[start:]
+    fence = stripped.find('```')
+    if fence != -1:
+        stripped = stripped[:fence]
+    # Drop prose after the object, but keep the tail of a truncated response
+    end = stripped.rfind('}')
+    if end != -1 and not any(char in stripped[end + 1:] for char in '"[{:,'):
+        stripped = stripped[:end + 1]
+    stripped = stripped.strip()
+    if stripped != text.strip():
+        fired.append('strip_fences')
+    return stripped
+
+
+def _next_significant(text, index):
+    while index < len(text) and text[index] in ' \t\r\n':
+        index += 1
+    return text[index] if index < len(text) else ''
+
+
+def _scan(text, fired):
+    """Rewrite `text` string by string, fixing quoting, control characters and trailing commas.
+
+    Returns the rewritten text, the bracket stack left open at the end, whether
+    a string is still open, and the offsets of the commas between members.
+    """
+    out = []
+    stack = []
+    commas = []
+    in_string = False
+    closing = '"'
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if char == '\\' and i + 1 < len(text):
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if char == closing or (closing != '"' and char == '"'):
+                if closing == '"' and _next_significant(text, i + 1) not in ',:}]':
+                    # An unescaped quote inside the string, not its end
+                    fired.append('escape_inner_quote')
+                    out.append('\\"')
+                else:
+                    out.append('"')
+                    in_string = False
+            elif char in CONTROL_ESCAPES:
+                fired.append('escape_control_character')
+                out.append(CONTROL_ESCAPES[char])
+            else:
+                out.append(char)
+        elif char == '"' or char in SMART_QUOTES:
+            if char != '"':
+                fired.append('smart_quotes')
+            in_string = True
+            closing = CLOSING_QUOTES if char in OPENING_QUOTES else '"'
+            out.append('"')
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+            out.append(char)
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            out.append(char)
+        elif char == ',':
+            if _next_significant(text, i + 1) in '}]':
+                fired.append('trailing_comma')
+            else:
+                commas.append((len(out), list(stack)))
+                out.append(char)
+        else:
+            out.append(char)
+        i += 1
+    return ''.join(out), stack, in_string, commas
+
+
+def _close(text, stack, in_string):
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if text.endswith(':'):
+        text += ' null'
+    return text + ''.join(reversed(stack))
+
+
+def repair_json(text):
+    """Apply local, deterministic fixes to a malformed JSON response.
+
+    Returns the repaired text and the names of the rules that fired.
+    """
+    fired = []
+    text = _strip_fences(text, fired)
+    text, stack, in_string, commas = _scan(text, fired)
+    fired = list(dict.fromkeys(fired))
+    if not stack and not in_string:
+        return text, fired
+
+    fired.append('close_truncated')
+    candidate = _close(text, stack, in_string)
+    try:
+        json.loads(candidate)
+        return candidate, fired
+    except json.JSONDecodeError:
+        pass
+    # Drop the incomplete trailing member and close what is left
+    for offset, open_stack in reversed(commas):
+        candidate = _close(text[:offset], open_stack, False)
+        try:
+            json.loads(candidate)
+            return candidate, fired
+        except json.JSONDecodeError:
+            continue
+    return candidate, fired
+
+
+def parse_with_repair(pydantic_parser, response, name=''):
+    """Parse `response`, falling back to local JSON repair.
+
+    Returns the parsed model (or None) and the text the caller should use for
+    any further repair attempts.
+    """
+    try:
+        return pydantic_parser.parse(response), response
+    except OutputParserException:
+        pass
+
+    repaired, fired = repair_json(response)
+    if not fired:
+        return None, response
+    repair_stats.update(fired)
+    try:
+        result = pydantic_parser.parse(repaired)
+    except OutputParserException:
+        return None, repaired
+    repair_stats['saved_retries'] += 1
+    logger.info(f"{name}: response repaired locally ({', '.join(sorted(set(fired)))})")
+    return result, repaired
+
+
+def log_repair_stats():
+    if repair_stats:
+        logger.info(
+            "Local JSON repairs: " + ', '.join(f"{rule}={count}" for rule, count in sorted(repair_stats.items())))
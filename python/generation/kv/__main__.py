@@ -0,0 +1,115 @@
+from generation.kv.client import connect
+from generation.kv.upload import upload
+from generation.kv.sync import sync
+from generation.kv.prompts import write_prompts
+from generation.kv.delete import KNOWN_PATTERNS, delete_matching
+from generation.kv import index
+from generation.records import iter_records
+from dotenv import load_dotenv
+import os
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    base_path = os.path.dirname(os.path.abspath('.env'))
+    data_path = os.path.join(base_path, os.getenv('DATA_PATH', 'data'))
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m generation.kv',
+        description="Maintain patient profiles in a Redis-compatible KV store such as Vercel KV")
+    parser.add_argument('--url', type=str, default=None,
+                        help="Redis URL (default: KV_URL or REDIS_URL from the environment)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    upload_parser = commands.add_parser('upload', help="Write every profile of a file")
+    upload_parser.add_argument('--file', type=str, default='profiles.json',
+                               help="Profiles as a JSON array or `.jsonl` file (relative to DATA_PATH)")
+    upload_parser.add_argument('--batch-size', type=int, default=500)
+    upload_parser.add_argument('--connections', type=int, default=4)
+
+    sync_parser = commands.add_parser(
+        'sync', help="Write only new or changed profiles of a file and delete the ones it no longer has")
+    sync_parser.add_argument('--file', type=str, default='profiles.json',
+                             help="Profiles as a JSON array or `.jsonl` file (relative to DATA_PATH)")
+    sync_parser.add_argument('--hashes-file', type=str, default='profile_hashes.json',
+                             help="Local copy of the profile hashes (relative to DATA_PATH)")
+    sync_parser.add_argument('--batch-size', type=int, default=500)
+    sync_parser.add_argument('--connections', type=int, default=4)
+    sync_parser.add_argument('--dry-run', action='store_true',
+                             help="Only report what would be written and deleted")
+
+    prompts_parser = commands.add_parser(
+        'prompts', help="Render and store the system prompt of every profile and patient type of a file")
+    prompts_parser.add_argument('--file', type=str, default='profiles.json',
+                                help="Profiles as a JSON array or `.jsonl` file (relative to DATA_PATH)")
+    prompts_parser.add_argument('--batch-size', type=int, default=500)
+    prompts_parser.add_argument('--connections', type=int, default=4)
+
+    delete_parser = commands.add_parser(
+        'delete', help="Delete every key matching one or more patterns, found with SCAN")
+    delete_parser.add_argument('patterns', nargs='+', metavar='pattern',
+                               help=f"Key pattern, e.g. {', '.join(KNOWN_PATTERNS)}")
+    delete_parser.add_argument('--batch-size', type=int, default=500,
+                               help="Keys per pipelined UNLINK")
+    delete_parser.add_argument('--count', type=int, default=1000,
+                               help="COUNT hint for every SCAN call")
+    delete_parser.add_argument('--dry-run', action='store_true',
+                               help="Only print how many keys match")
+
+    index_parser = commands.add_parser('index', help="Check or rebuild the sampling index")
+    index_parser.add_argument('action', choices=['check', 'rebuild'])
+
+    sample_parser = commands.add_parser('sample', help="Draw a random profile id from the index")
+    sample_parser.add_argument('--emotion', type=str, default=None,
+                               help="Canonical emotion id, e.g. `anxious`")
+    sample_parser.add_argument('--belief', type=str, default=None,
+                               help="Canonical core belief id, e.g. `incompetent`")
+    sample_parser.add_argument('--type', type=str, default=None,
+                               help="Patient type, e.g. `upset`")
+
+    args = parser.parse_args()
+
+    if args.command == 'upload':
+        client = connect(args.url, args.connections)
+        upload(iter_records(os.path.join(data_path, args.file)), client,
+               args.batch_size, args.connections)
+    elif args.command == 'sync':
+        client = connect(args.url, args.connections)
+        sync(iter_records(os.path.join(data_path, args.file)), client,
+             os.path.join(data_path, args.hashes_file), args.batch_size,
+             args.connections, args.dry_run)
+    elif args.command == 'prompts':
+        client = connect(args.url, args.connections)
+        upload(iter_records(os.path.join(data_path, args.file)), client,
+               args.batch_size, args.connections, write=write_prompts)
+    elif args.command == 'delete':
+        client = connect(args.url)
+        for pattern in args.patterns:
+            if pattern.strip('*') == '':
+                parser.error("refusing to delete every key, give a prefix")
+            matched = delete_matching(client, pattern, args.batch_size, args.count, args.dry_run)
+            if args.dry_run:
+                print(f"{pattern}\t{matched}")
+    elif args.command == 'index':
+        client = connect(args.url)
+        if args.action == 'rebuild':
+            index.rebuild(client)
+            return
+        problems = index.check(client)
+        for problem in problems:
+            logger.warning(problem)
+        if problems:
+            raise SystemExit(1)
+        logger.info("Index is consistent with the stored profiles")
+    elif args.command == 'sample':
+        print(index.sample(connect(args.url), emotion=args.emotion,
+                           belief=args.belief, type=args.type))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import json
+import hashlib
+from itertools import islice
+
+import redis
+
+PROFILE_PREFIX = 'profile_'
+
+
+def kv_url(url=None):
+    # Vercel KV exposes its Redis endpoint as KV_URL
+    return url or os.getenv('KV_URL') or os.getenv('REDIS_URL') or 'redis://localhost:6379'
+
+
+def connect(url=None, connections=1):
+    pool = redis.BlockingConnectionPool.from_url(
+        kv_url(url), max_connections=max(connections, 1), decode_responses=True)
+    return redis.Redis(connection_pool=pool)
+
+
+def profile_key(profile_id):
+    return f"{PROFILE_PREFIX}{profile_id}"
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def scan_keys(client, pattern, count=1000):
+    # Cursor-based, so the server is never blocked the way KEYS blocks it
+    return client.scan_iter(match=pattern, count=count)
+
+
+# Content hash of every stored profile, keyed by id
+HASHES_KEY = 'sync:profile:hashes'
+
+
+def profile_hash(profile):
+    return hashlib.sha256(
+        json.dumps(profile, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
@@ -0,0 +1,40 @@
+import logging
+
+from generation.kv.client import HASHES_KEY, PROFILE_PREFIX, batched, scan_keys
+from generation.kv.index import remove_from_index
+from generation.kv.prompts import all_prompt_keys
+
+logger = logging.getLogger(__name__)
+
+# Keyspaces the app and the uploader write, see `lib/utils/kvDatabaseFunctions.ts`
+KNOWN_PATTERNS = ['profile_*', 'prompt:*', 'curr_profile_*', 'curr_type_*', 'curr_prompt_*',
+                  'ccdResult:*', 'ccdTruth:*']
+
+
+def delete_matching(client, pattern, batch_size=500, count=1000, dry_run=False):
+    """Delete every key matching `pattern` in pipelined UNLINK batches.
+
+    Keys are found with SCAN so the server never blocks on a full keyspace
+    walk. Deleted profiles are also dropped from the sampling index and the
+    sync hashes, and their rendered prompts are deleted with them. Returns
+    the number of matching keys.
+    """
+    matched = 0
+    profile_ids = []
+    for keys in batched(scan_keys(client, pattern, count), batch_size):
+        matched += len(keys)
+        ids = [key[len(PROFILE_PREFIX):] for key in keys if key.startswith(PROFILE_PREFIX)]
+        profile_ids += ids
+        if not dry_run:
+            pipe = client.pipeline(transaction=False)
+            pipe.unlink(*keys)
+            prompt_keys = [key for profile_id in ids for key in all_prompt_keys(profile_id)]
+            if prompt_keys:
+                pipe.unlink(*prompt_keys)
+            pipe.execute()
+    if profile_ids and not dry_run:
+        remove_from_index(client, profile_ids, batch_size)
+        for batch in batched(profile_ids, batch_size):
+            client.hdel(HASHES_KEY, *batch)
+    logger.info(f"{pattern}: {'would delete' if dry_run else 'deleted'} {matched} keys")
+    return matched
@@ -0,0 +1,126 @@
+import json
+import random
+import logging
+
+from generation.kv.client import PROFILE_PREFIX, batched, profile_key, scan_keys
+from generation.vocabulary import normalize_belief_descriptions, normalize_emotions
+
+logger = logging.getLogger(__name__)
+
+# Kept outside `profile_*` so that pattern still only matches profiles
+INDEX_PREFIX = 'idx:profile:'
+IDS_KEY = f'{INDEX_PREFIX}ids'
+
+
+def facet_key(facet, value):
+    return f'{INDEX_PREFIX}{facet}:{value}'
+
+
+def _canonical(normalize, labels):
+    try:
+        return normalize(labels)
+    except ValueError:
+        return []
+
+
+def index_keys(profile):
+    """The index sets a profile belongs to, besides the set of all ids."""
+    beliefs = (profile.get('helpless_belief', []) + profile.get('unlovable_belief', [])
+               + profile.get('worthless_belief', []))
+    keys = [facet_key('emotion', emotion)
+            for emotion in _canonical(normalize_emotions, profile.get('emotion', []))]
+    keys += [facet_key('belief', belief)
+             for belief in _canonical(normalize_belief_descriptions, beliefs)]
+    keys += [facet_key('type', patient_type) for patient_type in profile.get('type', [])]
+    return keys
+
+
+def add_to_index(pipe, profiles):
+    pipe.sadd(IDS_KEY, *[profile['id'] for profile in profiles])
+    for profile in profiles:
+        for key in index_keys(profile):
+            pipe.sadd(key, profile['id'])
+
+
+def remove_from_index(client, profile_ids, batch_size=500):
+    """Drop ids from the set of all ids and from every facet set."""
+    if not profile_ids:
+        return
+    keys = list(scan_keys(client, f'{INDEX_PREFIX}*'))
+    for batch in batched(profile_ids, batch_size):
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.srem(key, *batch)
+        pipe.execute()
+
+
+def _draw(client, keys):
+    if len(keys) <= 1:
+        # O(1) on the server
+        return client.srandmember(keys[0] if keys else IDS_KEY)
+    members = client.sinter(keys)
+    return random.choice(sorted(members)) if members else None
+
+
+def sample(client, **facets):
+    """Pick a random profile id, optionally restricted to e.g. `emotion='sad', type='upset'`."""
+    keys = [facet_key(facet, value) for facet, value in facets.items() if value]
+    while True:
+        profile_id = _draw(client, keys)
+        if profile_id is None or client.exists(profile_key(profile_id)):
+            return profile_id
+        # Deleted without updating the facet sets, e.g. by the app's TypeScript
+        # helpers; every miss removes one stale id, so this ends
+        logger.warning(f"Profile {profile_id} is indexed but missing, removing it from the index")
+        remove_from_index(client, [profile_id])
+
+
+def iter_stored_profiles(client, batch_size=500):
+    for keys in batched(scan_keys(client, f'{PROFILE_PREFIX}*'), batch_size):
+        for value in client.mget(keys):
+            if value is not None:
+                yield json.loads(value)
+
+
+def expected_index(client, batch_size=500):
+    expected = {IDS_KEY: set()}
+    for profile in iter_stored_profiles(client, batch_size):
+        expected[IDS_KEY].add(profile['id'])
+        for key in index_keys(profile):
+            expected.setdefault(key, set()).add(profile['id'])
+    return expected
+
+
+def check(client, batch_size=500):
+    """Compare the index with the stored profiles and return a description of every difference."""
+    expected = expected_index(client, batch_size)
+    actual_keys = set(scan_keys(client, f'{INDEX_PREFIX}*'))
+    problems = []
+    for key in sorted(actual_keys | set(expected)):
+        actual = client.smembers(key) if key in actual_keys else set()
+        wanted = expected.get(key, set())
+        if actual - wanted:
+            problems.append(f"{key}: {len(actual - wanted)} stale ids, e.g. {sorted(actual - wanted)[:3]}")
+        if wanted - actual:
+            problems.append(f"{key}: {len(wanted - actual)} missing ids, e.g. {sorted(wanted - actual)[:3]}")
+    return problems
+
+
+def rebuild(client, batch_size=500):
+    """Recompute the index from the stored profiles and swap it in key by key."""
+    expected = expected_index(client, batch_size)
+    stale = set(scan_keys(client, f'{INDEX_PREFIX}*')) - set(expected)
+    pipe = client.pipeline(transaction=False)
+    for key, members in expected.items():
+        if not members:
+            continue
+        for chunk in batched(sorted(members), batch_size):
+            pipe.sadd(f'{key}:rebuild', *chunk)
+        pipe.rename(f'{key}:rebuild', key)
+    if not expected[IDS_KEY]:
+        stale.add(IDS_KEY)
+    if stale:
+        pipe.unlink(*stale)
+    pipe.execute()
+    logger.info(
+        f"Rebuilt index of {len(expected[IDS_KEY])} profiles in {len(expected)} sets, removed {len(stale)} stale sets")
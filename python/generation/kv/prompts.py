@@ -0,0 +1,32 @@
+from generation.patient_prompt import PATIENT_TYPE_INSTRUCTIONS, render_prompts
+
+PROMPT_PREFIX = 'prompt:'
+
+
+def prompt_key(profile_id, patient_type):
+    return f'{PROMPT_PREFIX}{profile_id}:{patient_type}'
+
+
+def all_prompt_keys(profile_id):
+    """Every prompt key a profile can have, one per known patient type."""
+    return [prompt_key(profile_id, patient_type) for patient_type in PATIENT_TYPE_INSTRUCTIONS]
+
+
+def rendered_prompts(profiles):
+    """Ready-to-use system prompts of `profiles` by key, one per profile and type."""
+    return {prompt_key(profile['id'], patient_type): prompt
+            for profile in profiles
+            for patient_type, prompt in render_prompts(profile).items()}
+
+
+def stale_prompt_keys(old, new):
+    """Prompt keys of `old` that `new`, the same profile, no longer has."""
+    return [prompt_key(old['id'], patient_type)
+            for patient_type in set(old.get('type', [])) - set(new.get('type', []))]
+
+
+def write_prompts(client, profiles):
+    prompts = rendered_prompts(profiles)
+    if prompts:
+        client.mset(prompts)
+    return len(profiles)
@@ -0,0 +1,106 @@
+import os
+import json
+import logging
+
+from generation.kv.client import HASHES_KEY, batched, profile_hash, profile_key
+from generation.kv.index import IDS_KEY, add_to_index, index_keys
+from generation.kv.prompts import prompt_key, rendered_prompts, stale_prompt_keys
+from generation.kv.upload import upload
+
+logger = logging.getLogger(__name__)
+
+
+def load_hashes(path):
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_hashes(path, hashes):
+    if path:
+        with open(path, 'w') as f:
+            json.dump(hashes, f, indent=4, sort_keys=True)
+
+
+def stored_hashes(client, local):
+    """The hashes in the KV side hash, which wins over the local copy."""
+    remote = client.hgetall(HASHES_KEY)
+    if local and local != remote:
+        logger.warning(
+            f"Local profile hashes differ from the KV ({len(local)} vs {len(remote)} profiles), syncing against the KV")
+    return remote
+
+
+def _stored_profiles(client, profile_ids):
+    values = client.mget([profile_key(profile_id) for profile_id in profile_ids])
+    return {profile_id: json.loads(value)
+            for profile_id, value in zip(profile_ids, values) if value is not None}
+
+
+def write_changed_batch(client, profiles):
+    """Like `write_batch`, also dropping the index sets and prompts changed profiles no longer have."""
+    prompts = rendered_prompts(profiles)
+    old = _stored_profiles(client, [profile['id'] for profile in profiles])
+    pipe = client.pipeline(transaction=False)
+    for profile in profiles:
+        if profile['id'] in old:
+            for key in set(index_keys(old[profile['id']])) - set(index_keys(profile)):
+                pipe.srem(key, profile['id'])
+            stale = stale_prompt_keys(old[profile['id']], profile)
+            if stale:
+                pipe.unlink(*stale)
+    pipe.mset({profile_key(profile['id']): json.dumps(profile) for profile in profiles})
+    if prompts:
+        pipe.mset(prompts)
+    pipe.hset(HASHES_KEY, mapping={profile['id']: profile_hash(profile) for profile in profiles})
+    add_to_index(pipe, profiles)
+    pipe.execute()
+    return len(profiles)
+
+
+def delete_profiles(client, profile_ids, batch_size=500):
+    for batch in batched(profile_ids, batch_size):
+        old = _stored_profiles(client, batch)
+        pipe = client.pipeline(transaction=False)
+        prompt_keys = []
+        for profile_id, profile in old.items():
+            for key in index_keys(profile):
+                pipe.srem(key, profile_id)
+            prompt_keys += [prompt_key(profile_id, patient_type) for patient_type in profile.get('type', [])]
+        pipe.srem(IDS_KEY, *batch)
+        pipe.unlink(*[profile_key(profile_id) for profile_id in batch], *prompt_keys)
+        pipe.hdel(HASHES_KEY, *batch)
+        pipe.execute()
+
+
+def sync(records, client, hashes_file=None, batch_size=500, connections=4, dry_run=False):
+    """Make the stored profiles match `records`, writing only new or changed ones.
+
+    Profiles missing from `records` are deleted. Returns the number of
+    written and deleted profiles.
+    """
+    stored = stored_hashes(client, load_hashes(hashes_file))
+    hashes = {}
+    counts = {'new': 0, 'changed': 0}
+
+    def changed():
+        for profile in records:
+            profile_id = str(profile['id'])
+            hashes[profile_id] = profile_hash(profile)
+            if stored.get(profile_id) != hashes[profile_id]:
+                counts['changed' if profile_id in stored else 'new'] += 1
+                yield profile
+
+    if dry_run:
+        written = sum(1 for _ in changed())
+    else:
+        written = upload(changed(), client, batch_size, connections, write=write_changed_batch)
+    removed = sorted(set(stored) - set(hashes))
+    if not dry_run:
+        delete_profiles(client, removed, batch_size)
+        save_hashes(hashes_file, hashes)
+    logger.info(
+        f"{'Would sync' if dry_run else 'Synced'} {len(hashes)} profiles: {counts['new']} new, "
+        f"{counts['changed']} changed, {len(removed)} deleted, {len(hashes) - written} unchanged")
+    return written, len(removed)
@@ -0,0 +1,46 @@
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from generation.kv.client import HASHES_KEY, batched, profile_hash, profile_key
+from generation.kv.index import add_to_index
+from generation.kv.prompts import rendered_prompts
+
+logger = logging.getLogger(__name__)
+
+
+def write_batch(client, profiles):
+    # Rendering first validates every profile before anything is written
+    prompts = rendered_prompts(profiles)
+    pipe = client.pipeline(transaction=False)
+    pipe.mset({profile_key(profile['id']): json.dumps(profile) for profile in profiles})
+    if prompts:
+        pipe.mset(prompts)
+    pipe.hset(HASHES_KEY, mapping={profile['id']: profile_hash(profile) for profile in profiles})
+    add_to_index(pipe, profiles)
+    pipe.execute()
+    return len(profiles)
+
+
+def upload(records, client, batch_size=500, connections=4, write=write_batch):
+    """Write `profile_<id>` keys in MSET batches spread over parallel connections.
+
+    Every profile also gets its system prompt for each of its patient types,
+    stored under `prompt:<id>:<type>`.
+
+    The sampling index is extended as profiles are written. Ids are only ever
+    added to it, use `sync` or run `index rebuild` after changing the facets of
+    existing profiles.
+    """
+    written = 0
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        pending = set()
+        for batch in batched(records, batch_size):
+            # Bound the batches in flight so the input keeps streaming
+            if len(pending) >= connections * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written += sum(future.result() for future in done)
+            pending.add(executor.submit(write, client, batch))
+        written += sum(future.result() for future in wait(pending).done)
+    logger.info(f"Uploaded {written} profiles")
+    return written
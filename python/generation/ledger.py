@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import logging
+from collections import defaultdict
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# USD per million prompt and completion tokens. Extend or override with
+# MODEL_PRICES, e.g. `{"heallama": [0, 0]}`
+DEFAULT_PRICES = {
+    'gpt-4': (30.0, 60.0),
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-3.5-turbo': (0.5, 1.5),
+}
+
+GROUPS = {'run': 'run_id', 'model': 'model', 'transcript': 'transcript', 'mode': 'mode'}
+
+_ledger = None
+
+# The `Racer` of the current call when it races a hedged duplicate
+current_racer = ContextVar('current_racer', default=None)
+
+
+def model_prices():
+    prices = dict(DEFAULT_PRICES)
+    prices.update({model: tuple(price)
+                   for model, price in json.loads(os.getenv('MODEL_PRICES') or '{}').items()})
+    return prices
+
+
+def cost(model, prompt_tokens, completion_tokens, prices):
+    """Estimated USD cost, or None for models without a known price."""
+    if model not in prices:
+        return None
+    prompt_price, completion_price = prices[model]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+class Ledger:
+    """SQLite log of every LLM call: tokens, model, attempt, cache hit and latency."""
+
+    def __init__(self, path, run_id=None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(2).hex()}"
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            "run_id TEXT, created_at REAL, transcript TEXT, model TEXT, temperature REAL, "
+            "mode TEXT, attempt INTEGER, cache_hit INTEGER, prompt_tokens INTEGER, "
+            "completion_tokens INTEGER, latency_ms REAL, hedge TEXT, won INTEGER)")
+        # Ledgers written before hedging lack its columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(calls)")}
+        for column, kind in (('hedge', 'TEXT'), ('won', 'INTEGER')):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE calls ADD COLUMN {column} {kind}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS calls_run ON calls (run_id)")
+        self.conn.commit()
+
+    def record(self, transcript, model, temperature, mode, attempt, cache_hit,
+               prompt_tokens=0, completion_tokens=0, latency_ms=0.0, hedge=None, won=None):
+        """Add a call and return its row id. `hedge` is `primary` or `hedge` for raced calls."""
+        cursor = self.conn.execute(
+            "INSERT INTO calls (run_id, created_at, transcript, model, temperature, mode, attempt, "
+            "cache_hit, prompt_tokens, completion_tokens, latency_ms, hedge, won) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.run_id, time.time(), transcript, model, temperature, mode, attempt,
+             int(cache_hit), prompt_tokens, completion_tokens, latency_ms, hedge, won))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def set_won(self, row_ids, won):
+        self.conn.executemany("UPDATE calls SET won = ? WHERE rowid = ?",
+                              [(int(won), row_id) for row_id in row_ids])
+        self.conn.commit()
+
+    def latencies(self, model, mode, limit=200):
+        """Latencies in ms of the latest completed requests, e.g. to seed a hedging policy."""
+        rows = self.conn.execute(
+            "SELECT latency_ms FROM calls WHERE model = ? AND mode = ? AND cache_hit = 0 "
+            "AND won IS NOT 0 AND latency_ms > 0 ORDER BY created_at DESC LIMIT ?",
+            (model, mode, limit)).fetchall()
+        return [latency for latency, in rows]
+
+    def latest_run(self):
+        row = self.conn.execute(
+            "SELECT run_id FROM calls ORDER BY created_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def report(self, group='run', run_id=None):
+        """Totals per `group` (run, model, transcript or mode), optionally for one run only."""
+        column = GROUPS[group]
+        query = (f"SELECT {column}, model, COUNT(*), SUM(cache_hit), SUM(prompt_tokens), "
+                 f"SUM(completion_tokens), SUM(CASE WHEN cache_hit THEN 0 ELSE latency_ms END), "
+                 f"MIN(created_at), SUM(hedge = 'hedge'), SUM(hedge = 'hedge' AND won = 1) FROM calls")
+        params = ()
+        if run_id:
+            query += " WHERE run_id = ?"
+            params = (run_id,)
+        query += f" GROUP BY {column}, model"
+
+        prices = model_prices()
+        totals = defaultdict(lambda: {"calls": 0, "cache_hits": 0, "prompt_tokens": 0,
+                                      "completion_tokens": 0, "latency_ms": 0.0, "cost": 0.0,
+                                      "started": None, "hedges": 0, "hedge_wins": 0})
+        for key, model, calls, hits, prompt_tokens, completion_tokens, latency_ms, started, \
+                hedges, hedge_wins in self.conn.execute(query, params):
+            row = totals[key]
+            row["calls"] += calls
+            row["cache_hits"] += hits
+            row["prompt_tokens"] += prompt_tokens
+            row["completion_tokens"] += completion_tokens
+            row["latency_ms"] += latency_ms
+            row["hedges"] += hedges or 0
+            row["hedge_wins"] += hedge_wins or 0
+            row["started"] = min(started, row["started"] or started)
+            call_cost = cost(model, prompt_tokens, completion_tokens, prices)
+            row["cost"] = None if call_cost is None or row["cost"] is None else row["cost"] + call_cost
+        return sorted(totals.items(), key=lambda item: item[1]["started"])
+
+    def close(self):
+        self.conn.close()
+
+
+def configure(path):
+    """Record calls to the ledger at `path` from now on, or stop recording if it is empty."""
+    global _ledger
+    if _ledger is not None:
+        _ledger.close()
+    _ledger = Ledger(path) if path else None
+    return _ledger
+
+
+def open_ledger(base_dir):
+    path = os.getenv('LEDGER_PATH', '.cache/ledger.sqlite')
+    return configure(os.path.join(base_dir, path) if path else None)
+
+
+def record_call(llm, message, mode, transcript=None, attempt=0, latency_ms=0.0, cancelled=False):
+    """Add one LLM call to the ledger. `message` is None when the cache answered or the call was cancelled."""
+    if _ledger is None:
+        return
+    usage = (getattr(message, 'usage_metadata', None) or {}) if message is not None else {}
+    racer = current_racer.get()
+    row_id = _ledger.record(
+        transcript, llm.model_name, llm.temperature, mode, attempt,
+        message is None and not cancelled, usage.get('input_tokens', 0),
+        usage.get('output_tokens', 0), latency_ms, racer.role if racer else None,
+        0 if cancelled else None)
+    if racer is not None:
+        racer.row_ids.append(row_id)
+
+
+def record_race(racers, winner):
+    """Mark the calls of a hedged race as won or lost once its winner is known."""
+    if _ledger is None:
+        return
+    for racer in racers:
+        _ledger.set_won(racer.row_ids, racer is winner)
+
+
+def recent_latencies(model, mode, limit=200):
+    return _ledger.latencies(model, mode, limit) if _ledger is not None else []
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    base_path = os.path.dirname(os.path.abspath('.env'))
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m generation.ledger', description="Report tokens and cost of generation runs")
+    parser.add_argument('--file', type=str, default=os.getenv('LEDGER_PATH') or '.cache/ledger.sqlite',
+                        help="Ledger written by `generation.generate` (default: LEDGER_PATH)")
+    parser.add_argument('--by', choices=list(GROUPS), default='run')
+    parser.add_argument('--run', type=str, default=None,
+                        help="Only this run id, or `latest`")
+    args = parser.parse_args()
+
+    ledger = Ledger(os.path.join(base_path, args.file))
+    run_id = ledger.latest_run() if args.run == 'latest' else args.run
+    rows = ledger.report(args.by, run_id)
+    ledger.close()
+    if not rows:
+        logger.warning("No calls recorded")
+        return
+    print(f"{args.by:<32} {'calls':>6} {'cached':>7} {'prompt tok':>11} {'compl tok':>10} "
+          f"{'avg ms':>8} {'cost $':>9} {'hedges':>7} {'won':>5}")
+    for key, row in rows:
+        requests = row["calls"] - row["cache_hits"]
+        average = row["latency_ms"] / requests if requests else 0
+        spent = f"{row['cost']:.4f}" if row["cost"] is not None else 'n/a'
+        print(f"{str(key):<32} {row['calls']:>6} {row['cache_hits']:>7} {row['prompt_tokens']:>11} "
+              f"{row['completion_tokens']:>10} {average:>8.0f} {spent:>9} {row['hedges']:>7} "
+              f"{row['hedge_wins']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class Manifest:
+    """Checkpoint of batch runs: the content hash, status, attempts and output of every transcript.
+
+    Every change is committed right away, so a run that dies leaves an
+    accurate record behind. Transcripts still marked `in_progress` were cut
+    off mid-run and are picked up again on restart.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "transcript TEXT PRIMARY KEY, content_hash TEXT, status TEXT, attempts INTEGER, "
+            "out_file TEXT, error TEXT, updated_at REAL)")
+        self.conn.commit()
+
+    def is_done(self, transcript, content_hash):
+        row = self.conn.execute(
+            "SELECT content_hash, status FROM transcripts WHERE transcript = ?",
+            (transcript,)).fetchone()
+        return row is not None and row == (content_hash, 'done')
+
+    def start(self, transcript, content_hash, out_file):
+        # A changed transcript starts over with a fresh attempt count
+        self.conn.execute(
+            "INSERT INTO transcripts VALUES (?, ?, 'in_progress', 1, ?, NULL, ?) "
+            "ON CONFLICT (transcript) DO UPDATE SET status = 'in_progress', error = NULL, "
+            "out_file = excluded.out_file, updated_at = excluded.updated_at, "
+            "attempts = CASE WHEN content_hash = excluded.content_hash THEN attempts + 1 ELSE 1 END, "
+            "content_hash = excluded.content_hash",
+            (transcript, content_hash, out_file, time.time()))
+        self.conn.commit()
+
+    def _set_status(self, transcript, status, error=None):
+        self.conn.execute(
+            "UPDATE transcripts SET status = ?, error = ?, updated_at = ? WHERE transcript = ?",
+            (status, error, time.time(), transcript))
+        self.conn.commit()
+
+    def finish(self, transcript):
+        self._set_status(transcript, 'done')
+
+    def fail(self, transcript, error):
+        self._set_status(transcript, 'failed', repr(error))
+
+    def counts(self, transcripts=None):
+        rows = self.conn.execute("SELECT transcript, status FROM transcripts").fetchall()
+        wanted = set(transcripts) if transcripts is not None else None
+        return Counter(status for transcript, status in rows
+                       if wanted is None or transcript in wanted)
+
+    def close(self):
+        self.conn.close()
+
+
+def open_manifest(base_dir, path=None):
+    path = path or os.getenv('MANIFEST_PATH', '.cache/manifest.sqlite')
+    return Manifest(os.path.join(base_dir, path))
@@ -0,0 +1,191 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+from generation.transcript import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying, the same as the OpenAI SDK's own retries
+RETRY_STATUSES = (408, 409, 429)
+
+
+def rate_limit_rpm():
+    return int(os.getenv('RATE_LIMIT_RPM') or 0)
+
+
+def rate_limit_tpm():
+    return int(os.getenv('RATE_LIMIT_TPM') or 0)
+
+
+def expected_completion_tokens():
+    # Providers count the expected completion against the TPM limit up front
+    return int(os.getenv('EXPECTED_COMPLETION_TOKENS', 1500))
+
+
+def max_retries():
+    return int(os.getenv('MAX_RETRIES', 4))
+
+
+def estimate_tokens(_input, model='gpt-4'):
+    """Tokens a request will cost: its rendered prompt plus the expected completion."""
+    text = _input.to_string() if hasattr(_input, 'to_string') else str(_input)
+    return count_tokens(text, model) + expected_completion_tokens()
+
+
+def retry_after(headers):
+    """Seconds the server asked us to wait in `Retry-After` (or `retry-after-ms`), or None."""
+    if headers is None:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):
+        # Includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRY_STATUSES or error.status_code >= 500
+    return False
+
+
+class TokenBucket:
+    """`limit` units per minute, refilled continuously.
+
+    Callers reserve units up front and may drive the bucket into debt; the
+    returned wait is how long until that debt is paid off. Reservations are
+    therefore served in order and a request larger than the whole bucket
+    still goes through, just later.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.rate = limit / 60
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        self.level = min(self.limit, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= amount
+        return max(-self.level / self.rate, 0.0)
+
+    def refund(self, amount):
+        self.level = min(self.limit, self.level + amount)
+
+
+class RateLimiter:
+    """Client-side scheduler that keeps requests under RPM and TPM limits.
+
+    Every request first reserves one request and its estimated tokens and
+    waits until both buckets allow it. 429s, overloads and timeouts are
+    retried here rather than in the OpenAI client: `Retry-After` pauses all
+    requests, and each retry backs off exponentially with full jitter so
+    that rejected requests do not come back in lockstep.
+    """
+
+    def __init__(self, rpm=0, tpm=0, retries=None, backoff_base=1.0, backoff_max=60.0,
+                 on_retry=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.retries = max_retries() if retries is None else retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Called with every error that is retried, e.g. to lower the concurrency
+        self.on_retry = on_retry
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def reserve(self, tokens):
+        """Book one request costing `tokens` and return how many seconds to wait before sending it."""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.paused_until - now, 0.0)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            self.stats['requests'] += 1
+            self.stats['wait_ms'] += int(wait * 1000)
+        return wait
+
+    def settle(self, estimated, used):
+        """Correct the TPM bucket once the actual token usage of a request is known."""
+        if self.tokens is None or not used:
+            return
+        with self.lock:
+            self.tokens.refund(estimated - used)
+
+    def refund(self, tokens):
+        """Give back the TPM reservation of a request that failed or was cancelled."""
+        if self.tokens is None:
+            return
+        with self.lock:
+            self.tokens.refund(tokens)
+
+    def retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after `error`, or None if it should be raised."""
+        if attempt >= self.retries or not is_retryable(error):
+            return None
+        response = getattr(error, 'response', None)
+        status = getattr(error, 'status_code', 'timeout')
+        self.stats[f'retry_{status}'] += 1
+        if self.on_retry is not None:
+            self.on_retry(error)
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        server_wait = retry_after(response.headers if response is not None else None)
+        if server_wait is None:
+            return backoff
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + server_wait)
+        return server_wait + backoff
+
+    async def acall(self, request, tokens):
+        """Await `request()` once the limits allow, retrying rate limits and transient errors."""
+        attempt = 0
+        while True:
+            wait = self.reserve(tokens)
+            try:
+                await asyncio.sleep(wait)
+                return await request()
+            except asyncio.CancelledError:
+                self.refund(tokens)
+                raise
+            except Exception as e:
+                # Each retry reserves again, so failed attempts must not keep theirs
+                self.refund(tokens)
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"Request failed with {e!r}, retrying in {delay:.1f}s "
+                               f"({attempt + 1}/{self.retries})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def log_stats(self):
+        if not self.stats['requests']:
+            return
+        retries = ', '.join(f"{name}={count}" for name, count in sorted(self.stats.items())
+                            if name.startswith('retry_'))
+        logger.info(f"Rate limiter: {self.stats['requests']} requests, "
+                    f"{self.stats['wait_ms'] / 1000:.1f}s spent waiting for capacity"
+                    + (f", retries: {retries}" if retries else ""))
@@ -0,0 +1,74 @@
+import json
+import textwrap
+
+
+class ProfileWriter:
+    """Write profiles one at a time as JSON lines or as a `profiles.json`-style array."""
+
+    def __init__(self, path):
+        self.jsonl = path.endswith('.jsonl')
+        self.f = open(path, 'w')
+        self.count = 0
+        if not self.jsonl:
+            self.f.write('[')
+
+    def write(self, profile):
+        if self.jsonl:
+            self.f.write(json.dumps(profile) + '\n')
+        else:
+            self.f.write((',\n' if self.count else '\n') +
+                         textwrap.indent(json.dumps(profile, indent=4), '    '))
+        self.count += 1
+
+    def close(self):
+        if not self.jsonl:
+            self.f.write('\n]\n')
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_records(path, chunk_size=1 << 16):
+    """Yield the records of a JSON lines file or a JSON array without loading the whole file."""
+    with open(path, 'r') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ''
+        started = False
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            while True:
+                buffer = buffer.lstrip()
+                if not buffer:
+                    break
+                if not started:
+                    if buffer[0] != '[':
+                        raise ValueError(f"{path} is not a JSON array")
+                    buffer = buffer[1:]
+                    started = True
+                elif buffer[0] == ',':
+                    buffer = buffer[1:]
+                elif buffer[0] == ']':
+                    return
+                else:
+                    try:
+                        record, end = decoder.raw_decode(buffer)
+                    except json.JSONDecodeError:
+                        # The record continues in the next chunk
+                        break
+                    yield record
+                    buffer = buffer[end:]
+            if not chunk:
+                if buffer.strip() or not started:
+                    raise ValueError(f"Unexpected end of {path}")
+                return
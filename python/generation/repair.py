@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import logging
+
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import ValidationError, create_model
+
+from generation.generation_template import GenerationModel
+from generation.ledger import record_call
+from generation.ratelimit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def max_repairs():
+    return int(os.getenv('MAX_REPAIRS', 2))
+
+
+def load_json(response):
+    try:
+        data = parse_json_markdown(response)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def find_invalid_fields(schema, data):
+    """Validate `data` and split it into the fields that passed and the errors of those that did not."""
+    try:
+        return schema.model_validate(data), {}, {}
+    except ValidationError as e:
+        errors = {}
+        for error in e.errors():
+            field = error['loc'][0] if error['loc'] else None
+            if field not in schema.model_fields:
+                continue
+            location = '.'.join(str(part) for part in error['loc'][1:])
+            message = f"{location}: {error['msg']}" if location else error['msg']
+            errors.setdefault(field, []).append(message)
+    valid = {field: value for field, value in data.items()
+             if field in schema.model_fields and field not in errors}
+    return None, valid, errors
+
+
+def build_repair_input(schema, data, valid, errors):
+    fields = {field: (schema.model_fields[field].annotation, schema.model_fields[field])
+              for field in errors}
+    repair_schema = create_model(f"{schema.__name__}Repair", **fields)
+    repair_parser = PydanticOutputParser(pydantic_object=repair_schema)
+
+    described_errors = []
+    for field, messages in errors.items():
+        described = f"- {field}: {'; '.join(messages)}"
+        if field in data:
+            described += f" (current value: {json.dumps(data[field])})"
+        described_errors.append(described)
+
+    _input = GenerationModel.repair_prompt_template.invoke({
+        "valid": json.dumps(valid, indent=1),
+        "errors": '\n'.join(described_errors),
+        "format_instructions": repair_parser.get_format_instructions()
+    })
+    return _input, repair_parser
+
+
+def _apply_repair(repair_parser, data, response):
+    repaired = load_json(response)
+    if repaired is None:
+        return data
+    return {**data, **{field: value for field, value in repaired.items()
+                       if field in repair_parser.pydantic_object.model_fields}}
+
+
+async def arepair_output(schema, response, llm, name='', semaphore=None, limiter=None,
+                         on_latency=None):
+    """Fix the fields of `response` that failed validation by re-asking only for them.
+
+    Returns the validated model, or None if the response is not JSON at all or
+    could not be repaired within `MAX_REPAIRS` rounds.
+    """
+    data = load_json(response)
+    if data is None:
+        return None
+    start = None
+
+    async def send(_input):
+        # Time only the request that got through, not the wait for capacity
+        nonlocal start
+        start = time.perf_counter()
+        message = await llm.ainvoke(_input)
+        if on_latency is not None:
+            on_latency(time.perf_counter() - start)
+        return message
+
+    for attempt in range(max_repairs()):
+        result, valid, errors = find_invalid_fields(schema, data)
+        if result is not None:
+            return result
+        if not errors:
+            return None
+        logger.warning(
+            f"{name}: repairing fields {', '.join(errors)} ({attempt + 1}/{max_repairs()})")
+        _input, repair_parser = build_repair_input(schema, data, valid, errors)
+        if limiter is None:
+            request = send(_input)
+        else:
+            request = limiter.acall(lambda: send(_input), estimate_tokens(_input))
+        if semaphore is None:
+            response = await request
+        else:
+            async with semaphore:
+                response = await request
+        record_call(llm, response, 'repair', name, attempt, (time.perf_counter() - start) * 1000)
+        data = _apply_repair(repair_parser, data, str(response.content))
+    result, _, _ = find_invalid_fields(schema, data)
+    return result
@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import glob
+import time
+import random
+import argparse
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_BLOCK = re.compile(r'```(?:json)?\s*(\{.*\})\s*```', re.DOTALL)
+
+
+def ccd_schema():
+    from generation.generation_template import GenerationModel
+    return GenerationModel.CognitiveConceptualizationDiagram.model_json_schema()
+
+
+def _resolve(schema, defs):
+    while '$ref' in schema:
+        schema = defs[schema['$ref'].split('/')[-1]]
+    if 'anyOf' in schema:
+        schema = next((option for option in schema['anyOf'] if option.get('type') != 'null'),
+                      schema['anyOf'][0])
+        return _resolve(schema, defs)
+    return schema
+
+
+def synthesize(schema, rng, defs=None, name='value'):
+    """A value that validates against a JSON schema, as generated by pydantic."""
+    defs = defs if defs is not None else schema.get('$defs', {})
+    schema = _resolve(schema, defs)
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    kind = schema.get('type')
+    if kind == 'object' or 'properties' in schema:
+        return {field: synthesize(field_schema, rng, defs, field)
+                for field, field_schema in schema.get('properties', {}).items()}
+    if kind == 'array':
+        items = _resolve(schema.get('items', {}), defs)
+        count = max(schema.get('minItems', 1), 1)
+        count = min(count + rng.randint(0, 1), schema.get('maxItems', count + 1))
+        if 'enum' in items:
+            return rng.sample(items['enum'], min(count, len(items['enum'])))
+        return [synthesize(items, rng, defs, name) for _ in range(count)]
+    if kind == 'integer':
+        return rng.randint(0, 10)
+    if kind == 'number':
+        return round(rng.random(), 3)
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    return f"Synthetic {name.replace('_', ' ')} #{rng.randint(1, 9999)}."
+
+
+def malform(text, rng):
+    """Break `text` the way real responses break: fences, trailing commas or truncation."""
+    breakage = rng.choice(['fence', 'trailing_comma', 'truncate'])
+    if breakage == 'fence':
+        return f"Here is the diagram:\n```json\n{text}\n```\nLet me know if you need anything else."
+    if breakage == 'trailing_comma':
+        return text[:text.rindex('}')] + ',}'
+    return text[:rng.randint(len(text) // 2, len(text) - 2)]
+
+
+class StubServer(ThreadingHTTPServer):
+    """OpenAI-compatible chat completions endpoint answering with schema-valid diagrams."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=200, jitter_ms=50, tokens_per_second=0,
+                 rate_limit_rate=0.0, server_error_rate=0.0, malformed_rate=0.0,
+                 slow_rate=0.0, slow_ms=5000, retry_after=1, fixtures=None, seed=0, capacity=0):
+        super().__init__(address, StubHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.malformed_rate = malformed_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.retry_after = retry_after
+        self.fixtures = fixtures or []
+        # Like a saturated provider: requests past `capacity` queue, so latency grows with load
+        self.capacity = threading.BoundedSemaphore(capacity) if capacity else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.ccd_fields = set(ccd_schema()['required'])
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def delay(self):
+        with self.lock:
+            delay = max(self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms), 0)
+            if self.rng.random() < self.slow_rate:
+                self.stats['slow'] += 1
+                delay += self.slow_ms
+        return delay / 1000
+
+    def answer(self, schema):
+        """The JSON text answering a request for `schema`."""
+        with self.lock:
+            if self.fixtures and set(schema.get('required', [])) == self.ccd_fields:
+                text = json.dumps(self.fixtures[self.stats['replayed'] % len(self.fixtures)])
+                self.stats['replayed'] += 1
+            else:
+                text = json.dumps(synthesize(schema, self.rng))
+            if self.rng.random() < self.malformed_rate:
+                self.stats['malformed'] += 1
+                text = malform(text, self.rng)
+        return text
+
+
+def request_schema(body):
+    """The schema the client asked for: the tool parameters or the format instructions."""
+    for tool in body.get('tools') or []:
+        return tool['function']['name'], tool['function'].get('parameters', {})
+    for message in reversed(body.get('messages', [])):
+        content = message.get('content')
+        match = SCHEMA_BLOCK.search(content) if isinstance(content, str) else None
+        if match:
+            return None, json.loads(match.group(1))
+    return None, ccd_schema()
+
+
+def count_message_tokens(messages):
+    return sum(len(message.get('content') or '') for message in messages) // 4
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, kind, message, headers=None):
+        self.server.count(f'status_{status}')
+        self.send_json(status, {"error": {"message": message, "type": kind, "code": kind}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self.send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        elif self.path.rstrip('/').endswith('/stats'):
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats))
+        else:
+            self.send_error_json(404, 'not_found', f"No route for {self.path}")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error_json(404, 'not_found', f"No route for {self.path}")
+            return
+        self.server.count('requests')
+        if self.server.capacity is None:
+            time.sleep(self.server.delay())
+        else:
+            with self.server.capacity:
+                time.sleep(self.server.delay())
+
+        if self.server.roll(self.server.rate_limit_rate):
+            self.send_error_json(429, 'rate_limit_exceeded', "Rate limit reached (stub)",
+                                 {'Retry-After': str(self.server.retry_after)})
+            return
+        if self.server.roll(self.server.server_error_rate):
+            self.send_error_json(503, 'server_error', "The server is overloaded (stub)")
+            return
+
+        tool_name, schema = request_schema(body)
+        text = self.server.answer(schema)
+        usage = {"prompt_tokens": count_message_tokens(body.get('messages', [])),
+                 "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion = {"id": f"chatcmpl-stub-{self.server.stats['requests']}",
+                      "created": int(time.time()), "model": body.get('model', 'stub')}
+        self.server.count('status_200')
+        if body.get('stream'):
+            self.stream(completion, text, tool_name, usage,
+                        (body.get('stream_options') or {}).get('include_usage'))
+            return
+
+        if self.server.tokens_per_second:
+            time.sleep(usage["completion_tokens"] / self.server.tokens_per_second)
+        if tool_name:
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": "call_stub", "type": "function",
+                "function": {"name": tool_name, "arguments": text}}]}
+        else:
+            message = {"role": "assistant", "content": text}
+        self.send_json(200, {**completion, "object": "chat.completion", "usage": usage, "choices": [
+            {"index": 0, "message": message, "finish_reason": "tool_calls" if tool_name else "stop"}]})
+
+    def stream(self, completion, text, tool_name, usage, include_usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def send(choices, **extra):
+            chunk = {**completion, "object": "chat.completion.chunk", "choices": choices, **extra}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        # Roughly one token per four characters, paced at `tokens_per_second`
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        interval = 1 / self.server.tokens_per_second if self.server.tokens_per_second else 0
+        if tool_name:
+            send([{"index": 0, "delta": {"role": "assistant", "content": None, "tool_calls": [{
+                "index": 0, "id": "call_stub", "type": "function",
+                "function": {"name": tool_name, "arguments": ""}}]}}])
+        else:
+            send([{"index": 0, "delta": {"role": "assistant", "content": ""}}])
+        for piece in pieces:
+            if interval:
+                time.sleep(interval)
+            if tool_name:
+                delta = {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]}
+            else:
+                delta = {"content": piece}
+            send([{"index": 0, "delta": delta}])
+        send([{"index": 0, "delta": {}, "finish_reason": "tool_calls" if tool_name else "stop"}])
+        if include_usage:
+            send([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def load_fixtures(pattern):
+    fixtures = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        with open(path, 'r') as f:
+            fixtures.append(json.load(f))
+    return fixtures
+
+
+def start(host='127.0.0.1', port=0, **options):
+    """Run a stub server in a background thread, e.g. for benchmarks. Call `shutdown()` when done."""
+    server = StubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog='python3 -m generation.stub',
+        description="Local OpenAI-compatible chat completions stub returning schema-valid diagrams")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('STUB_PORT', 8765)))
+    parser.add_argument('--latency-ms', type=float, default=200,
+                        help="Mean time before the first byte of every response")
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--tokens-per-second', type=float, default=0,
+                        help="Completion speed, also the pace of streamed chunks (0: instant)")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help="Share of requests answered with 429 and a Retry-After header")
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help="Seconds sent in the Retry-After header of 429 responses")
+    parser.add_argument('--server-error-rate', type=float, default=0.0,
+                        help="Share of requests answered with 503")
+    parser.add_argument('--malformed-rate', type=float, default=0.0,
+                        help="Share of responses with fenced, trailing-comma or truncated JSON")
+    parser.add_argument('--slow-rate', type=float, default=0.0,
+                        help="Share of requests delayed by another --slow-ms")
+    parser.add_argument('--slow-ms', type=float, default=5000)
+    parser.add_argument('--capacity', type=int, default=0,
+                        help="Requests worked on at once; more queue up and respond later (0: unlimited)")
+    parser.add_argument('--fixtures', type=str, default=None,
+                        help="Glob of diagram JSON files to replay instead of synthesized diagrams")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else []
+    server = StubServer((args.host, args.port), args.latency_ms, args.jitter_ms,
+                        args.tokens_per_second, args.rate_limit_rate, args.server_error_rate,
+                        args.malformed_rate, args.slow_rate, args.slow_ms, args.retry_after,
+                        fixtures, args.seed, args.capacity)
+    logger.info(f"Serving on {server.base_url} ({len(fixtures)} fixtures), set OPENAI_BASE_URL to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Stub stats: " + ', '.join(f"{name}={count}" for name, count in sorted(server.stats.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import json
+import math
+import time
+import argparse
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# (trace id, span id) of the innermost open span
+_current = ContextVar('current_span', default=(None, None))
+_tracer = None
+
+
+class Tracer:
+    """Appends finished spans to a JSON lines file, one record per span.
+
+    Records follow the OpenTelemetry span data model (trace and span ids,
+    parent, start and end in unix nanoseconds, attributes, status), so they
+    can be loaded into any OTLP tooling later without running a collector.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+
+    def emit(self, name, trace_id, span_id, parent_span_id, start_ns, end_ns, attributes, error=None):
+        record = {
+            "name": name,
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_span_id": parent_span_id,
+            "start_time_unix_nano": start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+            "attributes": attributes,
+            "status": {"code": "ERROR", "message": repr(error)} if error else {"code": "OK"},
+        }
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def configure(path):
+    """Write spans to `path` from now on, or stop tracing if it is empty."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(path) if path else None
+
+
+def open_tracer(base_dir):
+    path = os.getenv('TRACE_PATH', '.cache/traces.jsonl')
+    configure(os.path.join(base_dir, path) if path else None)
+
+
+def _new_id(length):
+    return os.urandom(length).hex()
+
+
+@contextmanager
+def span(name, new_trace=False, **attributes):
+    """Time the enclosed block as a child of the current span.
+
+    With `new_trace`, start a new trace instead, e.g. one per transcript.
+    Yields the attributes so the block can add to them.
+    """
+    if _tracer is None:
+        yield attributes
+        return
+    trace_id, parent_span_id = _current.get()
+    if new_trace or trace_id is None:
+        trace_id, parent_span_id = _new_id(16), None
+    span_id = _new_id(8)
+    token = _current.set((trace_id, span_id))
+    start_ns = time.time_ns()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        _tracer.emit(name, trace_id, span_id, parent_span_id, start_ns, time.time_ns(),
+                     attributes, error)
+
+
+def record_span(name, start_ns, end_ns, **attributes):
+    """Emit an already finished span under the current one, e.g. time to first token."""
+    if _tracer is None:
+        return
+    trace_id, parent_span_id = _current.get()
+    _tracer.emit(name, trace_id or _new_id(16), _new_id(8), parent_span_id,
+                 start_ns, end_ns, attributes)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def summarize(records):
+    durations = defaultdict(list)
+    for record in records:
+        mode = record['attributes'].get('mode')
+        durations[f"{record['name']} ({mode})" if mode else record['name']].append(record['duration_ms'])
+    rows = []
+    for name, values in durations.items():
+        values.sort()
+        rows.append((name, len(values), percentile(values, 0.5), percentile(values, 0.95),
+                     percentile(values, 0.99), values[-1]))
+    # Stages in the order they first ran
+    return rows
+
+
+def iter_spans(path, since=None):
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if since is None or record['start_time_unix_nano'] >= since:
+                yield record
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    base_path = os.path.dirname(os.path.abspath('.env'))
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m generation.tracing', description="Summarize generation trace spans")
+    parser.add_argument('--file', type=str, default=os.getenv('TRACE_PATH') or '.cache/traces.jsonl',
+                        help="Spans written by `generation.generate` (default: TRACE_PATH)")
+    parser.add_argument('--hours', type=float, default=None,
+                        help="Only spans that started in the last this many hours")
+    args = parser.parse_args()
+
+    since = time.time_ns() - int(args.hours * 3600e9) if args.hours else None
+    rows = summarize(iter_spans(os.path.join(base_path, args.file), since))
+    if not rows:
+        logger.warning("No spans found")
+        return
+    print(f"{'stage':<26} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for name, count, p50, p95, p99, slowest in rows:
+        print(f"{name:<26} {count:>7} {p50:>10.1f} {p95:>10.1f} {p99:>10.1f} {slowest:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
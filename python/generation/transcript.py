@@ -0,0 +1,178 @@
+import re
+import logging
+from collections import Counter
+from functools import lru_cache
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+SPEAKER_ABBREVIATIONS = {
+    'Therapist': 'T',
+    'Client': 'C',
+}
+
+FULL_WIDTH_PUNCTUATION = str.maketrans({
+    '，': ',',
+    '、': ',',
+    '。': '.',
+    '．': '.',
+    '：': ':',
+    '；': ';',
+    '？': '?',
+    '！': '!',
+    '（': '(',
+    '）': ')',
+    '“': '"',
+    '”': '"',
+    '‘': "'",
+    '’': "'",
+    '　': ' ',
+})
+
+# Short words that are never treated as extraction fragments, so that phrases
+# like `may be` or `any one` are left alone
+COMMON_WORDS = frozenset("""
+    a about after again all also am an and any are as at away back be been
+    before but by can come could day did do does done down each even ever for
+    from get go good got had has have he her here him his how if in into is it
+    its just know like made make man may me more most much must my new no not
+    now of off on one only or other our out over own per said same see she so
+    some still such take than that the their them then there these they thing
+    this those time to too two up upon us use very was way we well were what
+    when where which while who why will with would yet you your
+""".split())
+
+SPEAKER_PATTERN = re.compile(r'^([A-Z][A-Za-z]{0,30}):\s*(.*)$')
+WORD_PATTERN = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+SPACE_BEFORE_PUNCTUATION = re.compile(r'\s+([,.;:?!)])')
+FRAGMENT = re.compile(r'^([A-Za-z]+)([,.;:?!]*)$')
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use, which fails offline
+        logger.warning(
+            f"Could not load a tokenizer for {model}, estimating token counts: {e!r}")
+        return None
+
+
+def count_tokens(text, model='gpt-4'):
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def _is_fragment(word, vocabulary):
+    word = word.lower()
+    if len(word) == 1:
+        return word not in ('a', 'i')
+    return word not in COMMON_WORDS and vocabulary[word] <= 1
+
+
+def _repair_split_words(text, vocabulary):
+    # Rejoin words broken apart by PDF extraction, e.g. `fe e ling` -> `feeling`,
+    # when the joined word occurs elsewhere in the transcript and at least one
+    # of the pieces looks like a fragment (a stray letter or a word that is
+    # never seen anywhere else)
+    tokens = text.split(' ')
+    repaired = []
+    i = 0
+    while i < len(tokens):
+        for size in (4, 3, 2):
+            parts = tokens[i:i + size]
+            if len(parts) < size:
+                continue
+            matches = [FRAGMENT.match(part) for part in parts]
+            if not all(matches) or any(match.group(2) for match in matches[:-1]):
+                continue
+            words = [match.group(1) for match in matches]
+            joined = ''.join(words)
+            if vocabulary[joined.lower()] and any(
+                    _is_fragment(word, vocabulary) for word in words):
+                repaired.append(joined + matches[-1].group(2))
+                i += size
+                break
+        else:
+            repaired.append(tokens[i])
+            i += 1
+    return ' '.join(repaired)
+
+
+def _normalize_text(text):
+    text = text.translate(FULL_WIDTH_PUNCTUATION)
+    text = ' '.join(text.split())
+    return SPACE_BEFORE_PUNCTUATION.sub(r'\1', text)
+
+
+def split_turns(lines):
+    """Group raw transcript lines into `(speaker, text)` turns."""
+    turns = []
+    for line in lines:
+        line = _normalize_text(line)
+        if not line:
+            continue
+        match = SPEAKER_PATTERN.match(line)
+        if match:
+            speaker, text = match.groups()
+            if turns and turns[-1][0] == speaker:
+                turns[-1] = (speaker, f"{turns[-1][1]} {text}")
+            else:
+                turns.append((speaker, text))
+        elif turns:
+            turns[-1] = (turns[-1][0], f"{turns[-1][1]} {line}")
+        else:
+            turns.append((None, line))
+    return turns
+
+
+def format_turns(turns, abbreviate_speakers=False):
+    formatted = []
+    for speaker, text in turns:
+        if speaker is None:
+            formatted.append(text)
+            continue
+        if abbreviate_speakers:
+            speaker = SPEAKER_ABBREVIATIONS.get(speaker, speaker)
+        formatted.append(f"{speaker}: {text}")
+    return '\n'.join(formatted)
+
+
+def prepare_turns(lines):
+    turns = split_turns(lines)
+    vocabulary = Counter(word.lower() for _, text in turns
+                         for word in WORD_PATTERN.findall(text))
+    return [(speaker, _repair_split_words(text, vocabulary))
+            for speaker, text in turns]
+
+
+def prepare_transcript(lines, abbreviate_speakers=False):
+    return format_turns(prepare_turns(lines), abbreviate_speakers)
+
+
+def speaker_legend(abbreviate_speakers=False):
+    if abbreviate_speakers:
+        return "Note that `C` (Client) means the patient and `T` (Therapist) means the therapist in the transcript."
+    return "Note that `Client` means the patient in the transcript."
+
+
+def log_savings(lines, transcript, name='', model='gpt-4'):
+    # The prompt used to embed the list of raw lines, measure against that
+    before = count_tokens(str(lines), model)
+    after = count_tokens(transcript, model)
+    logger.info(
+        f"{name}: transcript compacted from {before} to {after} tokens "
+        f"({(before - after) / max(before, 1):.0%} saved)")
+
+
+def compact_transcript(lines, name='', abbreviate_speakers=False, model='gpt-4'):
+    transcript = prepare_transcript(lines, abbreviate_speakers)
+    log_savings(lines, transcript, name, model)
+    return transcript
@@ -0,0 +1,176 @@
+import re
+from difflib import get_close_matches
+from functools import lru_cache
+from typing import Annotated, List, Literal
+
+from pydantic import BeforeValidator
+
+# Canonical vocabularies, mirroring `app/api/data/emotions.tsx` and
+# `app/api/data/core-beliefs.tsx`. Ids and labels must stay in sync with the app.
+EMOTIONS = {
+    'anxious': 'anxious, worried, fearful, scared, tense',
+    'sad': 'sad, down, lonely, unhappy',
+    'angry': 'angry, mad, irritated, annoyed',
+    'ashamed': 'ashamed, embarrassed, humiliated',
+    'disappointed': 'disappointed',
+    'jealous': 'jealous, envious',
+    'guilty': 'guilty',
+    'hurt': 'hurt',
+    'Suspicious': 'suspicious',
+}
+
+CORE_BELIEFS = {
+    'helpless': {
+        'incompetent': 'I am incompetent.',
+        'helpless': 'I am helpless.',
+        'powerless': 'I am powerless, weak, vulnerable.',
+        'victim': 'I am a victim.',
+        'needy': 'I am needy.',
+        'trapped': 'I am trapped.',
+        'control': 'I am out of control.',
+        'failure': 'I am a failure, loser.',
+        'defective': 'I am defective.',
+    },
+    'unlovable': {
+        'unlovable': 'I am unlovable.',
+        'unattractive': 'I am unattractive.',
+        'undesirable': 'I am undesirable, unwanted.',
+        'rejected': 'I am bound to be rejected.',
+        'abandoned': 'I am bound to be abandoned.',
+        'alone': 'I am bound to be alone.',
+    },
+    'worthless': {
+        'worthless': 'I am worthless, waste.',
+        'immoral': 'I am immoral.',
+        'bad': 'I am bad - dangerous, toxic, evil.',
+        'deserve': "I don't deserve to live.",
+    },
+}
+
+# Category of every core belief id
+BELIEF_CATEGORY = {belief: category for category, beliefs in CORE_BELIEFS.items()
+                   for belief in beliefs}
+
+# Wording the model tends to use that is not part of the app's labels
+EMOTION_SYNONYMS = {
+    'anxious': ['anxiety', 'nervous', 'afraid', 'fear', 'stressed', 'panicked', 'overwhelmed'],
+    'sad': ['sadness', 'depressed', 'hopeless', 'miserable', 'low'],
+    'angry': ['anger', 'frustrated', 'irritable', 'resentful'],
+    'ashamed': ['shame', 'embarrassment', 'humiliation'],
+    'disappointed': ['disappointment'],
+    'jealous': ['jealousy', 'envy'],
+    'guilty': ['guilt'],
+    'hurt': ['wounded'],
+    'Suspicious': ['distrustful', 'mistrustful', 'paranoid'],
+}
+
+BELIEF_SYNONYMS = {
+    'failure': ['loser', 'a failure'],
+    'powerless': ['weak', 'vulnerable'],
+    'control': ['out of control'],
+    'undesirable': ['undesired', 'unwanted'],
+    'rejected': ['bound to be rejected'],
+    'abandoned': ['bound to be abandoned'],
+    'alone': ['bound to be alone', 'lonely'],
+    'worthless': ['waste', 'a waste'],
+    'bad': ['dangerous', 'toxic', 'evil'],
+    'deserve': ["don't deserve to live", 'do not deserve to live', 'undeserving'],
+}
+
+SEPARATORS = re.compile(r'\s*(?:[,/;|&+\n]|\s-\s|\band\b|\bor\b)\s*', re.IGNORECASE)
+PREFIXES = re.compile(r"^(?:i\s+am|i'm|im|i\s+feel|feeling|feels?)\s+", re.IGNORECASE)
+ARTICLES = re.compile(r'^(?:a|an|the)\s+')
+TRAILING = re.compile(r'\s*\b(?:core\s+)?beliefs?$')
+
+
+def _normalize_term(term):
+    term = term.strip().strip('`\'".:!-()[]').strip()
+    term = PREFIXES.sub('', term)
+    term = term.lower().replace('’', "'")
+    term = ' '.join(term.split())
+    return ARTICLES.sub('', term)
+
+
+def _build_table(labels, synonyms):
+    table = {}
+    for canonical, label in labels.items():
+        table[_normalize_term(canonical)] = canonical
+        for part in SEPARATORS.split(label):
+            if part:
+                table[_normalize_term(part)] = canonical
+        for synonym in synonyms.get(canonical, []):
+            table[_normalize_term(synonym)] = canonical
+    return table
+
+
+EMOTION_TABLE = _build_table(EMOTIONS, EMOTION_SYNONYMS)
+BELIEF_TABLE = _build_table(
+    {belief: label for beliefs in CORE_BELIEFS.values() for belief, label in beliefs.items()},
+    BELIEF_SYNONYMS)
+CATEGORY_TABLE = {_normalize_term(category): category for category in CORE_BELIEFS}
+
+
+@lru_cache(maxsize=4096)
+def _lookup(term, kind):
+    table = {'emotion': EMOTION_TABLE, 'belief': BELIEF_TABLE, 'category': CATEGORY_TABLE}[kind]
+    if kind == 'category':
+        term = TRAILING.sub('', term)
+    if term in table:
+        return table[term]
+    matches = get_close_matches(term, table.keys(), n=1, cutoff=0.85)
+    if matches:
+        return table[matches[0]]
+    # Longest known phrase contained in the term, e.g. `incompetent at work`
+    contained = [key for key in table if re.search(rf'\b{re.escape(key)}\b', term)]
+    if contained:
+        return table[max(contained, key=len)]
+    return None
+
+
+def _normalize(value, kind, what):
+    items = value if isinstance(value, (list, tuple)) else [value]
+    if not all(isinstance(item, str) for item in items):
+        # Leave it to pydantic to report the type error
+        return value
+    ids = []
+    for item in items:
+        found = [_lookup(term, kind) for term in map(_normalize_term, SEPARATORS.split(item))
+                 if term]
+        if not any(found):
+            # Phrases with separators inside, e.g. `I am bad - dangerous`
+            found = [_lookup(_normalize_term(item), kind)]
+        for canonical in found:
+            if canonical and canonical not in ids:
+                ids.append(canonical)
+    if items and not ids:
+        raise ValueError(f"No known {what} in {value!r}")
+    return ids
+
+
+def normalize_emotions(value):
+    return _normalize(value, 'emotion', 'emotion')
+
+
+def normalize_core_beliefs(value):
+    return _normalize(value, 'category', 'core belief category')
+
+
+def normalize_belief_descriptions(value):
+    return _normalize(value, 'belief', 'core belief')
+
+
+def emotion_label(emotion):
+    return EMOTIONS[emotion]
+
+
+def belief_label(belief):
+    return CORE_BELIEFS[BELIEF_CATEGORY[belief]][belief]
+
+
+# Field types that accept the model's wording and validate to canonical ids
+Emotions = Annotated[List[Literal[tuple(EMOTIONS)]],
+                     BeforeValidator(normalize_emotions)]
+CoreBeliefCategories = Annotated[List[Literal[tuple(CORE_BELIEFS)]],
+                                 BeforeValidator(normalize_core_beliefs)]
+CoreBeliefDescriptions = Annotated[List[Literal[tuple(BELIEF_CATEGORY)]],
+                                   BeforeValidator(normalize_belief_descriptions)]
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from generation import concurrency
+from generation.concurrency import AdaptiveLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(concurrency.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+async def run_requests(limit, clock, latencies):
+    for latency in latencies:
+        async with limit:
+            clock.now += latency
+            limit.observe(latency)
+
+
+def test_latency_burst_decreases_once(clock):
+    limit = AdaptiveLimit(16, initial=16)
+    asyncio.run(run_requests(limit, clock, [1.0] * 20 + [5.0] * 5 + [1.0] * 5))
+    assert limit.stats['decrease_latency'] == 1
+    assert limit.current == 8
+
+
+def test_steady_latency_does_not_decrease(clock):
+    limit = AdaptiveLimit(16, initial=16)
+    asyncio.run(run_requests(limit, clock, [1.0] * 30))
+    assert limit.current == 16
+    assert not limit.stats['decrease_latency']
+
+
+def test_overload_decreases(clock):
+    limit = AdaptiveLimit(16, initial=16)
+    limit.overloaded(None)
+    assert limit.current == 8
+    assert limit.stats['decrease_timeout'] == 1
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import BaseModel
+
+from generation.json_repair import parse_with_repair, repair_json
+
+
+class Answer(BaseModel):
+    name: str
+    items: list[int]
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": 1}',
+    '{"a": "x, y", "b": [1, {"c": null}], "d": "brace } and bracket ]"}',
+    '{"a": "already \\"escaped\\" and \\n newline"}',
+])
+def test_valid_json_is_left_alone(text):
+    assert repair_json(text) == (text, [])
+
+
+@pytest.mark.parametrize('text, expected, rule', [
+    ('```json\n{"a": 1}\n```', '{"a": 1}', 'strip_fences'),
+    ('Here it is: {"a": 1} hope it helps', '{"a": 1}', 'strip_fences'),
+    ('{"a": [1, 2,], }', '{"a": [1, 2] }', 'trailing_comma'),
+    ('{“a”: “b”}', '{"a": "b"}', 'smart_quotes'),
+    ('{"a": "line\nbreak"}', '{"a": "line\\nbreak"}', 'escape_control_character'),
+    ('{"a": "say "hi" now"}', '{"a": "say \\"hi\\" now"}', 'escape_inner_quote'),
+    ('{"a": "x", "b": [1, 2', '{"a": "x", "b": [1, 2]}', 'close_truncated'),
+    ('{"a": 1, "b": "tru', '{"a": 1, "b": "tru"}', 'close_truncated'),
+    ('{"a": 1, "b":', '{"a": 1, "b": null}', 'close_truncated'),
+])
+def test_repair_json(text, expected, rule):
+    repaired, fired = repair_json(text)
+    assert repaired == expected
+    assert rule in fired
+    json.loads(repaired)
+
+
+def test_truncated_member_is_dropped_when_closing_is_not_enough():
+    repaired, fired = repair_json('{"a": 1, "b": tr')
+    assert json.loads(repaired) == {"a": 1}
+    assert 'close_truncated' in fired
+
+
+@pytest.fixture
+def parser():
+    return PydanticOutputParser(pydantic_object=Answer)
+
+
+def test_parse_with_repair_valid(parser):
+    response = '{"name": "x", "items": [1, 2]}'
+    result, text = parse_with_repair(parser, response)
+    assert result == Answer(name="x", items=[1, 2])
+    assert text == response
+
+
+def test_parse_with_repair_fixes_locally(parser):
+    result, text = parse_with_repair(parser, '{"name": "x", "items": [1, 2,],}')
+    assert result == Answer(name="x", items=[1, 2])
+    assert json.loads(text) == {"name": "x", "items": [1, 2]}
+
+
+def test_parse_with_repair_gives_up_on_invalid_fields(parser):
+    response = '{"name": "x", "items": ["one"]}'
+    result, text = parse_with_repair(parser, response)
+    assert result is None
+    assert text == response
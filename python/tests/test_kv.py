@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from generation.kv import index
+from generation.kv.delete import delete_matching
+from generation.kv.upload import write_batch
+
+PROFILES = os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles.json')
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def profiles():
+    with open(PROFILES) as f:
+        return json.load(f)
+
+
+def test_delete_profiles_removes_their_prompts_and_index(client, profiles):
+    write_batch(client, profiles)
+    assert client.keys('prompt:*')
+
+    assert delete_matching(client, 'profile_*') == len(profiles)
+    assert client.keys('profile_*') == []
+    assert client.keys('prompt:*') == []
+    assert all(client.scard(key) == 0 for key in client.keys('idx:profile:*'))
+    assert client.hlen('sync:profile:hashes') == 0
+
+
+def test_delete_one_profile_keeps_the_others(client, profiles):
+    write_batch(client, profiles)
+    deleted, kept = profiles[0]['id'], profiles[1]['id']
+
+    delete_matching(client, f'profile_{deleted}')
+    assert client.keys(f'prompt:{deleted}:*') == []
+    assert client.keys(f'prompt:{kept}:*')
+    assert client.smembers('idx:profile:ids') == {profile['id'] for profile in profiles[1:]}
+
+
+def test_dry_run_deletes_nothing(client, profiles):
+    write_batch(client, profiles)
+    keys = set(client.keys('*'))
+    assert delete_matching(client, 'profile_*', dry_run=True) == len(profiles)
+    assert set(client.keys('*')) == keys
+
+
+def test_sample_skips_and_unindexes_missing_profiles(client, profiles):
+    write_batch(client, profiles)
+    deleted = profiles[0]['id']
+    # Deleted the way the app's TypeScript helpers do, leaving the facet sets
+    client.delete(f'profile_{deleted}')
+    client.srem('idx:profile:ids', deleted)
+
+    facets = {'type': profiles[0]['type'][0]}
+    for _ in range(20):
+        assert index.sample(client, **facets) != deleted
+    assert all(deleted not in client.smembers(key) for key in client.keys('idx:profile:*'))
+
+
+def test_sample_returns_none_when_only_stale_ids_match(client, profiles):
+    write_batch(client, profiles[:1])
+    client.delete(f"profile_{profiles[0]['id']}")
+    assert index.sample(client) is None
+    assert client.scard('idx:profile:ids') == 0
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from generation.ratelimit import RateLimiter, retry_after
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request('POST', 'http://localhost/v1'))
+
+
+def test_failed_attempts_give_their_tokens_back():
+    limiter = RateLimiter(tpm=60000, retries=3, backoff_base=0.001)
+    failures = 3
+
+    async def request():
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise connection_error()
+        return 'ok'
+
+    assert asyncio.run(limiter.acall(request, 10000)) == 'ok'
+    assert limiter.stats['retry_timeout'] == 3
+    # Only the attempt that got through still holds its reservation
+    assert limiter.tokens.level == pytest.approx(50000, abs=500)
+
+
+def test_errors_after_the_last_retry_raise_and_refund():
+    limiter = RateLimiter(tpm=60000, retries=1, backoff_base=0.001)
+
+    async def request():
+        raise connection_error()
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(limiter.acall(request, 10000))
+    assert limiter.tokens.level == pytest.approx(60000, abs=500)
+
+
+def test_cancelled_requests_refund():
+    limiter = RateLimiter(tpm=60000, retries=0)
+
+    async def main():
+        task = asyncio.create_task(limiter.acall(lambda: asyncio.sleep(10), 10000))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert limiter.tokens.level == pytest.approx(60000, abs=500)
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after': '2'}, 2.0),
+    ({'retry-after-ms': '1500'}, 1.5),
+    ({}, None),
+    (None, None),
+])
+def test_retry_after(headers, expected):
+    assert retry_after(headers) == expected
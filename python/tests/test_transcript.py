@@ -0,0 +1,54 @@
+from collections import Counter
+
+import pytest
+
+from generation.transcript import (_normalize_text, _repair_split_words, format_turns,
+                                   prepare_turns, split_turns)
+
+
+@pytest.mark.parametrize('text, vocabulary, expected', [
+    ('I was fe e ling anxious', {'feeling': 2}, 'I was feeling anxious'),
+    ('I was fe e ling, anxious.', {'feeling': 2}, 'I was feeling, anxious.'),
+    ('the wor k was hard', {'work': 3, 'wor': 1, 'k': 1}, 'the work was hard'),
+])
+def test_repair_split_words(text, vocabulary, expected):
+    assert _repair_split_words(text, Counter(vocabulary)) == expected
+
+
+@pytest.mark.parametrize('text, vocabulary', [
+    ('I was feeling anxious', {'feeling': 2}),
+    # Common words are never fragments, even if they join into a known word
+    ('I may be fine, any one can.', {'maybe': 1, 'anyone': 1, 'may': 1, 'be': 1, 'any': 1, 'one': 1}),
+    # The joined word must occur somewhere in the transcript
+    ('a fe e ling', {}),
+    # Punctuation inside the run means the words are not one broken word
+    ('fe, e ling', {'feeling': 1}),
+])
+def test_repair_split_words_leaves_intact_text_alone(text, vocabulary):
+    assert _repair_split_words(text, Counter(vocabulary)) == text
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Hello ， world 。  Really ？', 'Hello, world. Really?'),
+    ('So   I said ,  no .', 'So I said, no.'),
+    ('Nothing to change.', 'Nothing to change.'),
+])
+def test_normalize_text(text, expected):
+    assert _normalize_text(text) == expected
+
+
+def test_split_turns_merges_continuations_and_repeated_speakers():
+    lines = ['Therapist: How are you?\n', '\n', 'Client: Tired.\n', 'still tired\n', 'Client: yes\n']
+    assert split_turns(lines) == [('Therapist', 'How are you?'), ('Client', 'Tired. still tired yes')]
+
+
+def test_prepare_turns_repairs_words_seen_elsewhere():
+    lines = ['Therapist: How are you fe e ling?\n', 'Client: I am feeling tired.\n']
+    assert prepare_turns(lines) == [('Therapist', 'How are you feeling?'),
+                                    ('Client', 'I am feeling tired.')]
+
+
+def test_format_turns_abbreviates_speakers():
+    turns = [(None, 'Session 1'), ('Therapist', 'Hi.'), ('Client', 'Hello.')]
+    assert format_turns(turns) == 'Session 1\nTherapist: Hi.\nClient: Hello.'
+    assert format_turns(turns, abbreviate_speakers=True) == 'Session 1\nT: Hi.\nC: Hello.'
@@ -0,0 +1,76 @@
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from generation.vocabulary import (CoreBeliefDescriptions, Emotions, belief_label, emotion_label,
+                                   normalize_belief_descriptions, normalize_core_beliefs,
+                                   normalize_emotions)
+
+
+class Profile(BaseModel):
+    emotion: Emotions
+    belief: CoreBeliefDescriptions
+
+
+@pytest.mark.parametrize('value, expected', [
+    (['anxious', 'sad'], ['anxious', 'sad']),
+    (['Suspicious'], ['Suspicious']),
+    ([], []),
+])
+def test_canonical_emotions_are_kept(value, expected):
+    assert normalize_emotions(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (['ashamed/humiliated/embarrassed'], ['ashamed']),
+    (['Anxiety'], ['anxious']),
+    (['frustrated and sad'], ['angry', 'sad']),
+    (['anxous'], ['anxious']),
+    (['suspicious'], ['Suspicious']),
+    ('I feel hurt', ['hurt']),
+    (['worried', 'scared'], ['anxious']),
+])
+def test_normalize_emotions(value, expected):
+    assert normalize_emotions(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (['helpless', 'unlovable'], ['helpless', 'unlovable']),
+    (['Helpless belief'], ['helpless']),
+    (['Worthless core beliefs'], ['worthless']),
+])
+def test_normalize_core_beliefs(value, expected):
+    assert normalize_core_beliefs(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (['incompetent', 'failure'], ['incompetent', 'failure']),
+    (['I am incompetent.'], ['incompetent']),
+    (['I am bad - dangerous, toxic, evil.'], ['bad']),
+    (['I am incompetent at work'], ['incompetent']),
+    (["I don't deserve to live"], ['deserve']),
+    (['I am a loser'], ['failure']),
+])
+def test_normalize_belief_descriptions(value, expected):
+    assert normalize_belief_descriptions(value) == expected
+
+
+def test_unknown_terms_are_rejected():
+    with pytest.raises(ValueError, match="No known emotion"):
+        normalize_emotions(['purple'])
+
+
+def test_non_strings_are_left_to_pydantic():
+    assert normalize_emotions([1]) == [1]
+    with pytest.raises(ValidationError):
+        Profile(emotion=[1], belief=['helpless'])
+
+
+def test_field_types_validate_to_ids():
+    profile = Profile(emotion=['Anxiety', 'sadness'], belief=['I am helpless.'])
+    assert profile.emotion == ['anxious', 'sad']
+    assert profile.belief == ['helpless']
+
+
+def test_labels():
+    assert emotion_label('ashamed') == 'ashamed, embarrassed, humiliated'
+    assert belief_label('deserve') == "I don't deserve to live."